@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+from rule import Token, qa2d
+
+# Builds the input of Question and AnswerSpan (lists of Tokens) directly from a parser's in-memory
+# output, without writing and re-reading CoNLL-U. Question and AnswerSpan expect heads as in CoNLL-U
+# (1-based, 0 for the root) and shift them to 0-based themselves, so every head is normalized here.
+# With head_base=0, heads are 0-based token indices and the root is marked by -1, None or its own index.
+
+FIELDS = {
+    'form': ('form', 'text'),
+    'upostag': ('upostag', 'upos'),
+    'xpostag': ('xpostag', 'xpos'),
+    'head': ('head',),
+    'deprel': ('deprel',),
+}
+
+
+def _head(head, i, n, head_base):
+    if head_base == 0:
+        if head is None or head < 0 or head == i:
+            head = 0
+        else:
+            head += 1
+    elif head_base != 1:
+        raise ValueError('head_base must be 0 or 1, not {!r}'.format(head_base))
+    if not 0 <= head <= n:
+        raise ValueError('head {} of token {} is out of range'.format(head, i))
+    return head
+
+
+def tokens(forms, heads, deprels, xpostags, upostags=None, head_base=1):
+    # Tokens from parallel sequences, one value per word
+    n = len(forms)
+    if upostags is None:
+        upostags = [None] * n
+    if not len(heads) == len(deprels) == len(xpostags) == len(upostags) == n:
+        raise ValueError('forms, heads, deprels and tags must have the same length')
+    return [Token(forms[i], upostags[i], xpostags[i], _head(heads[i], i, n, head_base), deprels[i])
+            for i in range(n)]
+
+
+def _get(word, column):
+    names = FIELDS[column]
+    if isinstance(word, dict):
+        for name in names:
+            if name in word:
+                return word[name]
+    else:
+        for name in names:
+            if hasattr(word, name):
+                return getattr(word, name)
+    if column == 'upostag':
+        return None
+    raise ValueError('word {!r} has no {} field'.format(word, column))
+
+
+def from_words(words, head_base=1):
+    # Tokens from a sequence of words, each a dict or an object with the CoNLL-U field names
+    # (form, upostag, xpostag, head, deprel) or the short ones (text, upos, xpos, head, deprel),
+    # e.g. the words of a stanza Sentence (head_base=1)
+    n = len(words)
+    return [Token(_get(w, 'form'), _get(w, 'upostag'), _get(w, 'xpostag'),
+                  _head(_get(w, 'head'), i, n, head_base), _get(w, 'deprel'))
+            for i, w in enumerate(words)]
+
+
+def qa2d_parsed(question, answer, head_base=1):
+    # qa2d on a question and an answer given as parsed words (see from_words)
+    return qa2d(from_words(question, head_base), from_words(answer, head_base))
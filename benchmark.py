@@ -0,0 +1,733 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+import argparse
+import heapq
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter, OrderedDict
+from functools import partial
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+# Cumulative time (ms) allowed for the median `import rule` in a fresh interpreter, as reported by
+# -X importtime. It measures 3-5 ms with up-to-date bytecode, and single runs vary by a few ms on a busy
+# machine, so the budget leaves room for that; an eager import of re or numpy still goes well over it.
+IMPORT_BUDGET_MS = 10.0
+
+
+def measure_import(module='rule', repeat=11):
+    # Median of several fresh interpreters, started outside the repo to check that imports do not depend on
+    # cwd, and whether any of them imported pattern. A first run, not counted, writes the bytecode.
+    times = []
+    pattern_imported = False
+    code = 'import sys; import {0}; sys.exit(3 if "pattern" in sys.modules else 0)'.format(module)
+    env = dict(os.environ, PYTHONPATH=HERE)
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    with tempfile.TemporaryDirectory() as cwd:
+        for i in range(repeat + 1):
+            proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=cwd, env=env,
+                                  stderr=subprocess.PIPE, universal_newlines=True)
+            if proc.returncode == 3:
+                pattern_imported = True
+            elif proc.returncode != 0:
+                raise RuntimeError('import {} failed:\n{}'.format(module, proc.stderr))
+            if i == 0:
+                continue
+            for line in proc.stderr.splitlines():
+                fields = [f.strip() for f in line.split('|')]
+                if len(fields) == 3 and fields[2] == module:
+                    times.append(int(fields[1]) / 1000.0)
+    times.sort()
+    return times[len(times) // 2], pattern_imported
+
+
+def check_import(module='rule', budget=IMPORT_BUDGET_MS, repeat=11):
+    # Problems with the import of module: over budget, or importing pattern
+    ms, pattern_imported = measure_import(module, repeat)
+    problems = []
+    if ms > budget:
+        problems.append('import {}: {:.1f} ms, over the budget of {:.1f} ms'.format(module, ms, budget))
+    if pattern_imported:
+        problems.append('import {}: imports pattern, which should only be loaded on first use'.format(module))
+    return ms, problems
+
+
+def run_import(args):
+    ms, problems = check_import(args.module, args.budget, args.repeat)
+    print('import {}: {:.1f} ms (budget {:.1f} ms) {}'.format(args.module, ms, args.budget,
+                                                              'OK' if len(problems) == 0 else 'FAILED'))
+    for problem in problems:
+        sys.stderr.write(problem + '\n')
+    return 0 if len(problems) == 0 else 1
+
+
+class CheckSkipped(Exception):
+    # Raised by a check that cannot run here, with the reason
+    pass
+
+
+def run_check(args):
+    # Checks that can run in CI; exits with a non-zero status if any of them fails
+    problems = []
+    for name, check in CHECKS:
+        try:
+            found = check()
+        except CheckSkipped as e:
+            print('{}: SKIPPED ({})'.format(name, e))
+            continue
+        print('{}: {}'.format(name, 'OK' if len(found) == 0 else 'FAILED'))
+        problems.extend(found)
+    for problem in problems:
+        sys.stderr.write(problem + '\n')
+    return 0 if len(problems) == 0 else 1
+
+
+# Synthetic question/answer pairs, one template per answer type found by Question.get_answer_pos.
+# Each token is (form, upostag, xpostag, head label, deprel) and is labelled by its form; 'ADJ*' marks
+# where the padding adjectives (amod of the following noun) go, which varies the question length.
+TEMPLATES = OrderedDict([
+    ('WHAT_HAPPENED_TO', (
+        [('What', 'PRON', 'WP', 'happened', 'nsubj'), ('happened', 'VERB', 'VBD', None, 'root'),
+         ('to', 'ADP', 'IN', 'city', 'case'), ('the', 'DET', 'DT', 'city', 'det'), 'ADJ*',
+         ('city', 'NOUN', 'NN', 'happened', 'obl'), ('?', 'PUNCT', '.', 'happened', 'punct')],
+        [('a', 'DET', 'DT', 'flood', 'det'), ('flood', 'NOUN', 'NN', None, 'root')])),
+    ('WHAT_HAPPENED', (
+        [('What', 'PRON', 'WP', 'happened', 'nsubj'), ('happened', 'VERB', 'VBD', None, 'root'),
+         ('in', 'ADP', 'IN', 'war', 'case'), ('the', 'DET', 'DT', 'war', 'det'), 'ADJ*',
+         ('war', 'NOUN', 'NN', 'happened', 'obl'), ('?', 'PUNCT', '.', 'happened', 'punct')],
+        [('the', 'DET', 'DT', 'city', 'det'), ('city', 'NOUN', 'NN', 'fell', 'nsubj'),
+         ('fell', 'VERB', 'VBD', None, 'root')])),
+    ('NO_WH_MOV', (
+        [('The', 'DET', 'DT', 'city', 'det'), 'ADJ*', ('city', 'NOUN', 'NN', 'located', 'nsubj:pass'),
+         ('is', 'AUX', 'VBZ', 'located', 'aux:pass'), ('located', 'VERB', 'VBN', None, 'root'),
+         ('in', 'ADP', 'IN', 'country', 'case'), ('what', 'DET', 'WDT', 'country', 'det'),
+         ('country', 'NOUN', 'NN', 'located', 'obl'), ('?', 'PUNCT', '.', 'located', 'punct')],
+        [('France', 'PROPN', 'NNP', None, 'root')])),
+    ('COMPL', (
+        [('Where', 'ADV', 'WRB', 'live', 'advmod'), ('did', 'AUX', 'VBD', 'live', 'aux'),
+         ('the', 'DET', 'DT', 'painter', 'det'), 'ADJ*', ('painter', 'NOUN', 'NN', 'live', 'nsubj'),
+         ('live', 'VERB', 'VB', None, 'root'), ('?', 'PUNCT', '.', 'live', 'punct')],
+        [('Paris', 'PROPN', 'NNP', None, 'root')])),
+    ('SUBJ', (
+        [('Who', 'PRON', 'WP', 'wrote', 'nsubj'), ('wrote', 'VERB', 'VBD', None, 'root'),
+         ('the', 'DET', 'DT', 'novel', 'det'), 'ADJ*', ('novel', 'NOUN', 'NN', 'wrote', 'obj'),
+         ('?', 'PUNCT', '.', 'wrote', 'punct')],
+        [('Jane', 'PROPN', 'NNP', None, 'root'), ('Austen', 'PROPN', 'NNP', 'Jane', 'flat')])),
+    ('VERB', (
+        [('What', 'PRON', 'WP', 'do', 'obj'), ('did', 'AUX', 'VBD', 'do', 'aux'),
+         ('the', 'DET', 'DT', 'team', 'det'), 'ADJ*', ('team', 'NOUN', 'NN', 'do', 'nsubj'),
+         ('do', 'VERB', 'VB', None, 'root'), ('?', 'PUNCT', '.', 'do', 'punct')],
+        [('win', 'VERB', 'VB', None, 'root'), ('the', 'DET', 'DT', 'cup', 'det'),
+         ('cup', 'NOUN', 'NN', 'win', 'obj')])),
+    ('DOBJ', (
+        [('What', 'PRON', 'WP', 'approve', 'obj'), ('did', 'AUX', 'VBD', 'approve', 'aux'),
+         ('the', 'DET', 'DT', 'committee', 'det'), 'ADJ*', ('committee', 'NOUN', 'NN', 'approve', 'nsubj'),
+         ('approve', 'VERB', 'VB', None, 'root'), ('?', 'PUNCT', '.', 'approve', 'punct')],
+        [('the', 'DET', 'DT', 'budget', 'det'), ('budget', 'NOUN', 'NN', None, 'root')])),
+])
+
+ADJECTIVES = ['old', 'large', 'famous', 'northern', 'small', 'ancient', 'local', 'modern']
+
+
+def _conllu_sentence(template, n_adj, rng):
+    toks = []
+    for i, t in enumerate(template):
+        if t == 'ADJ*':
+            head = template[i + 1][0]
+            toks.extend((rng.choice(ADJECTIVES), 'ADJ', 'JJ', head, 'amod') for _ in range(n_adj))
+        else:
+            toks.append(t)
+    ids = dict((t[0], i + 1) for i, t in reversed(list(enumerate(toks))) if t[3] != 'amod')
+    lines = []
+    for i, (form, upos, xpos, head, deprel) in enumerate(toks):
+        lines.append('\t'.join([str(i + 1), form, '_', upos, xpos, '_', str(ids[head] if head else 0),
+                                deprel, '_', '_']))
+    return '\n'.join(lines) + '\n\n'
+
+
+def generate_corpus(n, max_pad=20, seed=0):
+    # Yields n CoNLL-U question/answer pairs, cycling through the templates with 0 to max_pad adjectives
+    rng = random.Random(seed)
+    templates = list(TEMPLATES.values())
+    for i in range(n):
+        question, answer = templates[i % len(templates)]
+        yield _conllu_sentence(question, rng.randint(0, max_pad), rng) + _conllu_sentence(answer, 0, rng)
+
+
+def run_corpus(args):
+    with open(args.output, 'w', encoding='utf-8') as f:
+        for pair in generate_corpus(args.n, args.max_pad, args.seed):
+            f.write(pair)
+    return 0
+
+
+def _moses():
+    try:
+        from sacremoses import MosesDetokenizer
+    except ImportError:
+        return None
+    return MosesDetokenizer(lang='en').detokenize
+
+
+def _detokenizer(name='builtin'):
+    if name == 'moses':
+        moses = _moses()
+        if moses is None:
+            sys.exit('the moses detokenizer needs sacremoses')
+        return moses
+    if name == 'join':
+        return ' '.join
+    from detok import detokenize
+    return detokenize
+
+
+class StageTimer(object):
+    def __init__(self):
+        self.totals = OrderedDict()
+
+    def __call__(self, stage, func, *args):
+        start = time.perf_counter()
+        result = func(*args)
+        self.totals[stage] = self.totals.get(stage, 0.0) + time.perf_counter() - start
+        return result
+
+
+def _length_bucket(n, width=10):
+    lo = n // width * width
+    return '{}-{}'.format(lo, lo + width - 1)
+
+
+def measure_stages(text, detok_name='builtin'):
+    from qa2d import read_pairs
+    from rule import Question, AnswerSpan
+
+    timer = StageTimer()
+    detokenize = _detokenizer(detok_name)
+    types = Counter()
+    by_length = {}
+    examples = 0
+    pairs = read_pairs(io.StringIO(text))
+    while True:
+        pair = timer('parse', next, pairs, None)
+        if pair is None:
+            break
+        examples += 1
+        start = time.perf_counter()
+        q = timer('construct', Question, pair[0])
+        by_length.setdefault(_length_bucket(len(q.question)), []).append(time.perf_counter() - start)
+        a = timer('construct', AnswerSpan, pair[1])
+        if not (q.isvalid and a.isvalid):
+            types['INVALID'] += 1
+            continue
+        timer('get_answer_pos', q.get_answer_pos, a)
+        types[q.type] += 1
+        timer('insert_answer_default', q.insert_answer_default, a)
+        words = timer('format_declr', q.format_declr)
+        timer('detokenize', detokenize, words)
+
+    stages = OrderedDict((stage, OrderedDict([('total_s', round(total, 6)),
+                                              ('per_example_us', round(total / max(examples, 1) * 1e6, 3))]))
+                         for stage, total in timer.totals.items())
+    construct_us = OrderedDict((bucket, round(sum(ts) / len(ts) * 1e6, 3))
+                               for bucket, ts in sorted(by_length.items(), key=lambda b: int(b[0].split('-')[0])))
+    return OrderedDict([('examples', examples), ('detokenizer', detok_name), ('stages', stages),
+                        ('question_init_us_by_length', construct_us), ('types', OrderedDict(sorted(types.items())))])
+
+
+def compare(report, baseline, tolerance):
+    # Stages that got slower than the baseline by more than tolerance (a fraction)
+    regressions = []
+    for stage, cur in report['stages'].items():
+        old = baseline.get('stages', {}).get(stage)
+        if old is not None and cur['per_example_us'] > old['per_example_us'] * (1 + tolerance):
+            regressions.append((stage, old['per_example_us'], cur['per_example_us']))
+    return regressions
+
+
+def run_stages(args):
+    if args.input is not None:
+        with open(args.input, 'r', encoding='utf-8') as f:
+            text = f.read()
+    else:
+        text = ''.join(generate_corpus(args.n, args.max_pad, args.seed))
+
+    best = None
+    for _ in range(args.repeat):
+        report = measure_stages(text, args.detokenizer)
+        if best is None:
+            best = report
+        else:
+            for stage, timing in report['stages'].items():
+                if timing['total_s'] < best['stages'][stage]['total_s']:
+                    best['stages'][stage] = timing
+    print(json.dumps(best, indent=2))
+
+    status = 0
+    if args.baseline is not None and os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        for stage, old, cur in compare(best, baseline, args.tolerance):
+            sys.stderr.write('REGRESSION {}: {:.1f} us -> {:.1f} us per example\n'.format(stage, old, cur))
+            status = 1
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(best, f, indent=2)
+    return status
+
+
+def _declaratives(text):
+    from qa2d import read_pairs
+    from rule import qa2d, OK
+
+    return [result.declr for result in (qa2d(q, a) for q, a in read_pairs(io.StringIO(text)))
+            if result.status == OK]
+
+
+def _throughput(func, sentences, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for words in sentences:
+            func(words)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return OrderedDict([('total_s', round(best, 6)),
+                        ('per_sentence_us', round(best / max(len(sentences), 1) * 1e6, 3))])
+
+
+def run_detok(args):
+    # Compares the built-in detokenizer with the Moses detokenizer on the output of qa2d
+    if args.input is not None:
+        with open(args.input, 'r', encoding='utf-8') as f:
+            text = f.read()
+    else:
+        text = ''.join(generate_corpus(args.n, args.max_pad, args.seed))
+    sentences = _declaratives(text)
+    builtin = _detokenizer('builtin')
+    report = OrderedDict([('sentences', len(sentences)),
+                          ('builtin', _throughput(builtin, sentences, args.repeat))])
+    moses = _moses()
+    if moses is not None:
+        report['moses'] = _throughput(moses, sentences, args.repeat)
+        report['speedup'] = round(report['moses']['total_s'] / max(report['builtin']['total_s'], 1e-9), 2)
+        differ = [words for words in sentences if builtin(words) != moses(words)]
+        report['agreement'] = round(1 - len(differ) / max(len(sentences), 1), 4)
+        report['differences'] = [OrderedDict([('builtin', builtin(words)), ('moses', moses(words))])
+                                 for words in differ[:args.show]]
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+def _parse_rate(parse, text, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        sentences = parse(text)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    mb = len(text.encode('utf-8')) / 1e6
+    return len(sentences), OrderedDict([('total_s', round(best, 6)), ('mb_per_s', round(mb / best, 2))])
+
+
+def run_parse(args):
+    # Compares the throughput of reader.parse with conllu.parse on the same text
+    import reader
+
+    if args.input is not None:
+        with open(args.input, 'r', encoding='utf-8') as f:
+            text = f.read()
+    else:
+        text = ''.join(generate_corpus(args.n, args.max_pad, args.seed))
+    n, lean = _parse_rate(reader.parse, text, args.repeat)
+    report = OrderedDict([('mb', round(len(text.encode('utf-8')) / 1e6, 3)), ('sentences', n), ('reader', lean)])
+    try:
+        import conllu
+    except ImportError:
+        conllu = None
+    if conllu is not None:
+        n_conllu, full = _parse_rate(conllu.parse, text, args.repeat)
+        report['conllu'] = full
+        report['speedup'] = round(full['total_s'] / max(lean['total_s'], 1e-9), 2)
+        if n_conllu != n:
+            sys.stderr.write('conllu.parse found {} sentences, reader.parse {}\n'.format(n_conllu, n))
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+class StageMemory(object):
+    # Like StageTimer, for the memory traced by tracemalloc (which has to be tracing). Per stage: what
+    # the calls leave allocated (net) and how far they go above the memory traced when they started
+    # (peak). Per example (since start_example): the peak of every stage above the memory traced when
+    # the example started. peak is the highest memory traced since the meter was created.
+    def __init__(self):
+        self.totals = OrderedDict()
+        self.example = OrderedDict()
+        self.start = self.example_start = tracemalloc.get_traced_memory()[0]
+        self.peak = self.start
+
+    def start_example(self):
+        self.example = OrderedDict()
+        self.example_start = tracemalloc.get_traced_memory()[0]
+
+    def __call__(self, stage, func, *args):
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        result = func(*args)
+        current, peak = tracemalloc.get_traced_memory()
+        self.peak = max(self.peak, peak)
+        total = self.totals.setdefault(stage, {'calls': 0, 'net': 0, 'peak': 0, 'max_peak': 0})
+        total['calls'] += 1
+        total['net'] += current - before
+        total['peak'] += peak - before
+        total['max_peak'] = max(total['max_peak'], peak - before)
+        self.example[stage] = max(self.example.get(stage, 0), peak - self.example_start)
+        return result
+
+
+# The steps of Question.insert_answer_default, measured one by one by _convert_stages
+INSERT_STEPS = ('get_answer_pos', 'rewrite', 'default_answer', 'insert_answer')
+
+
+def _convert_stages(meter, pair, detokenize, copy=False):
+    # The stages of qa2d on one parsed pair, measured with meter; returns the answer type, or INVALID.
+    # The steps of Question.insert_answer_default are shadowed on the instance by their metered
+    # versions, under their method names.
+    from rule import Question, AnswerSpan
+
+    if copy:
+        from copy import deepcopy
+        pair = meter('copy', deepcopy, pair)
+    q = meter('construct', Question, pair[0])
+    a = meter('construct', AnswerSpan, pair[1])
+    if not (q.isvalid and a.isvalid):
+        return 'INVALID'
+    for name in INSERT_STEPS:
+        setattr(q, name, partial(meter, name, getattr(q, name)))
+    q.insert_answer_default(a)
+    words = meter('format_declr', q.format_declr)
+    meter('detokenize', detokenize, words)
+    return q.type
+
+
+def _allocation_sites(f, offset, detokenize, copy=False, limit=3):
+    # Runs the pair at byte offset of the binary file f again, with a snapshot around every stage, and
+    # returns the source lines that allocated the most in each stage
+    from qa2d import read_pairs_at
+
+    class Sites(object):
+        def __init__(self):
+            self.sizes = OrderedDict()
+
+        def __call__(self, stage, func, *args):
+            before = tracemalloc.take_snapshot().filter_traces(ignore)
+            result = func(*args)
+            diff = tracemalloc.take_snapshot().filter_traces(ignore).compare_to(before, 'lineno')
+            sizes = self.sizes.setdefault(stage, Counter())
+            for stat in diff:
+                if stat.size_diff > 0:
+                    frame = stat.traceback[0]
+                    sizes['{}:{}'.format(os.path.basename(frame.filename), frame.lineno)] += stat.size_diff
+            return result
+
+    ignore = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+    # Filtering compiles the patterns the first time, which would count as an allocation of the first stage
+    tracemalloc.take_snapshot().filter_traces(ignore)
+    # read_pairs_at only seeks to an offset other than 0
+    f.seek(offset)
+    pairs = read_pairs_at(f, offset)
+    sites = Sites()
+    try:
+        _convert_stages(sites, sites('parse', next, pairs)[1], detokenize, copy)
+    except Exception:
+        # Like qa2d, which reports an error; the stages before it are shown
+        pass
+    return OrderedDict((stage, OrderedDict(sizes.most_common(limit))) for stage, sizes in sites.sizes.items())
+
+
+def measure_memory(f, detok_name='builtin', copy=False, worst=10, sites=3):
+    # Allocations and peak memory of every stage over all the pairs of the CoNLL-U file f (binary, and
+    # seekable if sites > 0), traced by tracemalloc. The file is read one pair at a time, so the maximum
+    # RSS does not grow with its size.
+    # The worst examples are the ones that go furthest above the memory traced before they were parsed;
+    # their allocation sites come from running them again from their byte offset.
+    # The resources rule.py loads on first use are loaded before, and reported on their own.
+    import rule
+    import verbs
+    from qa2d import read_pairs_at
+
+    detokenize = _detokenizer(detok_name)
+    types = Counter()
+    worst_heap = []
+    examples = 0
+    offset = 0
+    pairs = read_pairs_at(f)
+    tracemalloc.start()
+    try:
+        rule.get_common_preps()
+        # The verb table, and the backend for the verbs it lacks ('be' is in the table)
+        verbs.conjugate('be', verbs.PAST)
+        verbs.has_pattern()
+        resources = tracemalloc.get_traced_memory()[0]
+        meter = StageMemory()
+        while True:
+            meter.start_example()
+            item = meter('parse', next, pairs, None)
+            if item is None:
+                break
+            end, pair = item
+            try:
+                qtype = _convert_stages(meter, pair, detokenize, copy)
+            except Exception:
+                qtype = 'ERROR'
+            types[qtype] += 1
+            # The earlier example comes first among equal peaks
+            item = (max(meter.example.values()), -examples, examples, offset, qtype, len(pair[0]),
+                    ' '.join(tok.form for tok in pair[0]), meter.example)
+            if len(worst_heap) < worst:
+                heapq.heappush(worst_heap, item)
+            elif worst > 0:
+                heapq.heappushpop(worst_heap, item)
+            examples += 1
+            offset = end
+        worst_examples = []
+        for peak, _, index, start, qtype, length, question, by_stage in sorted(worst_heap, reverse=True):
+            example = OrderedDict([('index', index), ('type', qtype), ('length', length),
+                                   ('peak_bytes', peak), ('peak_bytes_by_stage', by_stage), ('question', question)])
+            if sites > 0:
+                example['top_allocations'] = _allocation_sites(f, start, detokenize, copy, sites)
+            worst_examples.append(example)
+    finally:
+        tracemalloc.stop()
+
+    stages = OrderedDict()
+    for stage, total in meter.totals.items():
+        stages[stage] = OrderedDict([('calls', total['calls']),
+                                     ('net_bytes_per_example', round(total['net'] / max(examples, 1), 1)),
+                                     ('mean_peak_bytes', round(total['peak'] / max(total['calls'], 1), 1)),
+                                     ('max_peak_bytes', total['max_peak'])])
+    report = OrderedDict([('examples', examples), ('detokenizer', detok_name), ('deepcopy', copy),
+                          ('stages', stages), ('resources_bytes', resources),
+                          ('run_peak_bytes', meter.peak - meter.start)])
+    try:
+        import resource
+        # Kilobytes on Linux, bytes on macOS
+        report['max_rss'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    except ImportError:
+        pass
+    report['types'] = OrderedDict(sorted(types.items()))
+    report['worst'] = worst_examples
+    return report
+
+
+def run_memory(args):
+    if args.input is not None:
+        f = open(args.input, 'rb')
+    else:
+        f = io.BytesIO(''.join(generate_corpus(args.n, args.max_pad, args.seed)).encode('utf-8'))
+    with f:
+        report = measure_memory(f, args.detokenizer, args.deepcopy, args.worst, args.sites)
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+# Pairs whose conversion differed from the original eagerly computed Question at some point, with the
+# (declarative, type, answer position) the original gives: (label, question, answer, expected)
+BASELINE_OUTPUTS = [
+    # A modal and 'be' make the copula the root of the rewriting, but dangling_prep looks at the parse root
+    ('modal copula', [('What', 'PRON', 'WP', 'dependent', 'obl'), ('will', 'AUX', 'MD', 'dependent', 'aux'),
+                      ('the', 'DET', 'DT', 'result', 'det'), ('result', 'NOUN', 'NN', 'dependent', 'nsubj'),
+                      ('be', 'AUX', 'VB', 'dependent', 'cop'), ('dependent', 'ADJ', 'JJ', None, 'root'),
+                      ('on', 'ADP', 'IN', 'dependent', 'obl'), ('in', 'ADP', 'IN', 'end', 'case'),
+                      ('the', 'DET', 'DT', 'end', 'det'), ('end', 'NOUN', 'NN', 'dependent', 'obl'),
+                      ('?', 'PUNCT', '.', 'dependent', 'punct')],
+     [('the', 'DET', 'DT', 'weather', 'det'), ('weather', 'NOUN', 'NN', None, 'root')],
+     ('The result will be dependent on the weather in the end.', 'COMPL', 7)),
+]
+
+
+def check_baseline_outputs():
+    # Problems with the conversion of BASELINE_OUTPUTS: a pair that no longer gets its original result
+    import rule
+    from detok import detokenize
+    from qa2d import read_pairs
+
+    problems = []
+    rng = random.Random(0)
+    for label, question, answer, expected in BASELINE_OUTPUTS:
+        text = _conllu_sentence(question, 0, rng) + _conllu_sentence(answer, 0, rng)
+        result = rule.qa2d(*next(read_pairs(io.StringIO(text))))
+        found = (None if result.declr is None else detokenize(result.declr), result.type, result.answer_pos)
+        if found != expected:
+            problems.append('{}: {!r}, expected {!r}'.format(label, found, expected))
+    return problems
+
+
+def check_feature_reuse(transforms=8):
+    # Problems with reusing one analyzed Question: a lazily computed feature computed more than once
+    # while the question is transformed with several answers and asked for its candidates
+    import rule
+    from qa2d import read_pairs
+
+    calls = Counter()
+    features = [attr for attr in vars(rule.Question).values() if isinstance(attr, rule._lazy)]
+
+    def counted(name, func):
+        def wrapper(self):
+            calls[name] += 1
+            return func(self)
+        return wrapper
+
+    originals = [attr.func for attr in features]
+    for attr in features:
+        attr.func = counted(attr.name, attr.func)
+    problems = []
+    try:
+        rng = random.Random(0)
+        for label, (question, answer) in TEMPLATES.items():
+            text = _conllu_sentence(question, 2, rng) + _conllu_sentence(answer, 0, rng)
+            question, answer = next(read_pairs(io.StringIO(text)))
+            q = rule.Question(question)
+            calls.clear()
+            for _ in range(transforms):
+                q.transform(rule.AnswerSpan([tok.copy() for tok in answer]))
+            q.nbest(rule.AnswerSpan([tok.copy() for tok in answer]))
+            problems.extend('{}: Question.{} computed {} times for {} answers'.format(label, name, n, transforms + 1)
+                            for name, n in sorted(calls.items()) if n > 1)
+    finally:
+        for attr, func in zip(features, originals):
+            attr.func = func
+    return problems
+
+
+def check_prefilter():
+    # Problems with --prefilter: a pair that gets another result with it than without it, from a CoNLL-U
+    # file or from a binary corpus. The answers include the edge cases of answer_valid: empty (only a
+    # comment line), only punctuation, one word. Some questions and answers miss a column ('_'), on which
+    # the rules fail.
+    try:
+        from features import prefilter, corpus_prefilter
+    except ImportError:
+        raise CheckSkipped('needs numpy')
+    import rule
+    from corpus import Corpus, write_corpus
+    from qa2d import read_pairs
+    from reader import iter_sentences, parse_columns
+
+    answers = ['# no words\n\n', '1\t.\t_\tPUNCT\t.\t_\t0\troot\t_\t_\n\n',
+               '1\tParis\t_\tPROPN\tNNP\t_\t0\troot\t_\t_\n\n', '1\t.\t_\tPUNCT\t.\t_\t_\troot\t_\t_\n\n']
+    rng = random.Random(0)
+    text = ''.join(_conllu_sentence(question, 1, rng) + answer
+                   for question, _ in TEMPLATES.values() for answer in answers)
+    # A question without a wh-word, for which the prefilter decides alone
+    text += _conllu_sentence([('Paris', 'PROPN', 'NNP', 'is', 'nsubj'), ('is', 'AUX', 'VBZ', None, 'root')], 0, rng)
+    text += answers[2]
+    # A wh-word without xpostag, and a head missing in a question without a wh-word
+    where = _conllu_sentence(TEMPLATES['COMPL'][0], 0, rng).replace('\tWRB\t', '\t_\t')
+    text += ''.join(where + answer for answer in answers)
+    text += _conllu_sentence([('Paris', 'PROPN', 'NNP', 'is', 'nsubj'), ('is', 'AUX', 'VBZ', None, 'root')], 0,
+                             rng).replace('\t2\tnsubj', '\t_\tnsubj')
+    text += answers[1]
+
+    expected = [rule.qa2d(question, answer) for question, answer in read_pairs(io.StringIO(text))]
+    sentences = iter_sentences(io.StringIO(text), parse_columns)
+    problems = ['pair {}: {} without --prefilter, {} with it'.format(i, a.status, b.status)
+                for i, (a, b) in enumerate(zip(expected, rule.qa2d_batch(prefilter(zip(sentences, sentences)),
+                                                                         workers=1))) if a != b]
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, 'pairs.qa2d')
+        write_corpus(iter_sentences(io.StringIO(text)), path)
+        corpus = Corpus(path)
+        found = rule.qa2d_batch(corpus_prefilter(corpus, enumerate(corpus.pairs())), workers=1)
+        problems.extend('pair {}: {} without --prefilter, {} with it from a binary corpus'.format(
+            i, a.status, b.status) for i, (a, b) in enumerate(zip(expected, found)) if a != b)
+    return problems
+
+
+# (name, function returning a list of problems) run by the check command
+CHECKS = [('import', lambda: check_import()[1]), ('feature reuse', check_feature_reuse),
+          ('prefilter', check_prefilter), ('baseline outputs', check_baseline_outputs)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks for the rule-based QA2D model.')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    p = subparsers.add_parser('import', help='check the import time of rule.py against its budget')
+    p.add_argument('--module', default='rule')
+    p.add_argument('--budget', type=float, default=IMPORT_BUDGET_MS, help='budget in ms (default: %(default)s)')
+    p.add_argument('--repeat', type=int, default=11, help='take the median of this many runs (default: %(default)s)')
+    p.set_defaults(func=run_import)
+
+    p = subparsers.add_parser('check', help='run the checks meant for CI (import budget and others), '
+                                            'with a non-zero exit status if any fails')
+    p.set_defaults(func=run_check)
+
+    p = subparsers.add_parser('corpus', help='write a synthetic CoNLL-U corpus of question/answer pairs')
+    p.add_argument('-o', '--output', required=True)
+    p.add_argument('-n', type=int, default=10000, help='number of pairs (default: %(default)s)')
+    p.add_argument('--max-pad', type=int, default=20, help='max adjectives added to a question (default: %(default)s)')
+    p.add_argument('--seed', type=int, default=0)
+    p.set_defaults(func=run_corpus)
+
+    p = subparsers.add_parser('stages', help='time every stage of the pipeline and compare with a baseline')
+    p.add_argument('input', nargs='?', help='CoNLL-U file (default: a synthetic corpus generated in memory)')
+    p.add_argument('-n', type=int, default=7000, help='pairs in the synthetic corpus (default: %(default)s)')
+    p.add_argument('--max-pad', type=int, default=40)
+    p.add_argument('--seed', type=int, default=0)
+    p.add_argument('--repeat', type=int, default=3, help='keep the best of this many runs (default: %(default)s)')
+    p.add_argument('--baseline', default='bench_baseline.json', help='baseline report (default: %(default)s)')
+    p.add_argument('--save-baseline', action='store_true', help='write the report as the new baseline')
+    p.add_argument('--tolerance', type=float, default=0.2,
+                   help='allowed slowdown per stage before failing (default: %(default)s)')
+    p.add_argument('--detokenizer', choices=['builtin', 'moses', 'join'], default='builtin',
+                   help='detokenizer timed in the detokenize stage (default: %(default)s)')
+    p.set_defaults(func=run_stages)
+
+    p = subparsers.add_parser('detok', help='compare the built-in detokenizer with the Moses detokenizer')
+    p.add_argument('input', nargs='?', help='CoNLL-U file (default: a synthetic corpus generated in memory)')
+    p.add_argument('-n', type=int, default=7000, help='pairs in the synthetic corpus (default: %(default)s)')
+    p.add_argument('--max-pad', type=int, default=40)
+    p.add_argument('--seed', type=int, default=0)
+    p.add_argument('--repeat', type=int, default=3, help='keep the best of this many runs (default: %(default)s)')
+    p.add_argument('--show', type=int, default=5, help='sentences on which they differ to show (default: %(default)s)')
+    p.set_defaults(func=run_detok)
+
+    p = subparsers.add_parser('parse', help='compare the throughput of reader.parse with conllu.parse')
+    p.add_argument('input', nargs='?', help='CoNLL-U file (default: a synthetic corpus generated in memory)')
+    p.add_argument('-n', type=int, default=7000, help='pairs in the synthetic corpus (default: %(default)s)')
+    p.add_argument('--max-pad', type=int, default=40)
+    p.add_argument('--seed', type=int, default=0)
+    p.add_argument('--repeat', type=int, default=3, help='keep the best of this many runs (default: %(default)s)')
+    p.set_defaults(func=run_parse)
+
+    p = subparsers.add_parser('memory', help='allocations and peak memory of every stage, with the worst examples')
+    p.add_argument('input', nargs='?', help='CoNLL-U file (default: a synthetic corpus generated in memory)')
+    p.add_argument('-n', type=int, default=7000, help='pairs in the synthetic corpus (default: %(default)s)')
+    p.add_argument('--max-pad', type=int, default=40)
+    p.add_argument('--seed', type=int, default=0)
+    p.add_argument('--detokenizer', choices=['builtin', 'moses', 'join'], default='builtin',
+                   help='detokenizer of the format stage (default: %(default)s)')
+    p.add_argument('--deepcopy', action='store_true',
+                   help='deep-copy every parsed pair before constructing it, as the example notebook does')
+    p.add_argument('--worst', type=int, default=10,
+                   help='examples with the highest peak to list (default: %(default)s)')
+    p.add_argument('--sites', type=int, default=3,
+                   help='source lines that allocate the most to show per stage of the worst examples '
+                        '(0 for none, default: %(default)s)')
+    p.set_defaults(func=run_memory)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
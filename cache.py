@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict, deque
+
+from rule import QA2DResult, count_result, token_columns
+
+# Cache of QA2DResults keyed by a hash of the columns rule.py reads (form, upostag, xpostag, head,
+# deprel) of the question and the answer. An in-memory LRU sits in front of an optional SQLite file.
+# The file records the rule version it was written with (rule_version) and is emptied when opened
+# with another one, so changing the rules or their resources invalidates it.
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+VERSION_FILES = ['rule.py', 'verbs.py', 'inflections.tsv', 'preps.txt']
+
+_rule_version = None
+
+
+def rule_version():
+    # Hash of the rule sources and resources, and of the verb backend verbs.py falls back to
+    global _rule_version
+    if _rule_version is None:
+        from importlib.util import find_spec
+        h = hashlib.blake2b(digest_size=16)
+        for name in VERSION_FILES:
+            path = os.path.join(HERE, name)
+            h.update(name.encode('utf-8') + b'\0')
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    h.update(f.read())
+        h.update(b'pattern' if find_spec('pattern') is not None else b'regular')
+        _rule_version = h.hexdigest()
+    return _rule_version
+
+
+def pair_key(question, answer):
+    # Stable key of an unprocessed pair (conllu tokens, Tokens or corpus sentence views, heads as in CoNLL-U)
+    h = hashlib.blake2b(digest_size=16)
+    for sent in (question, answer):
+        rows = sent.columns() if hasattr(sent, 'columns') else [token_columns(tok) for tok in sent]
+        h.update('\x1e'.join('\x1f'.join(map(str, row)) for row in rows).encode('utf-8') + b'\x1d')
+    return h.hexdigest()
+
+
+class ResultCache(object):
+    def __init__(self, path=None, size=100000, version=None, commit_every=1000):
+        self.size = size
+        self.version = version or rule_version()
+        self.commit_every = commit_every
+        self.hits = {'memory': 0, 'disk': 0}
+        self.misses = 0
+        self._lru = OrderedDict()
+        self._pending = []
+        self._keys = deque()
+        self._lock = threading.Lock()
+        self._db = None
+        if path is not None:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute('CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)')
+            self._db.execute('CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, status TEXT, declr TEXT, '
+                             'type TEXT, answer_pos INTEGER)')
+            row = self._db.execute("SELECT value FROM meta WHERE name = 'rule_version'").fetchone()
+            if row is None or row[0] != self.version:
+                self._db.execute('DELETE FROM results')
+                self._db.execute("INSERT OR REPLACE INTO meta VALUES ('rule_version', ?)", (self.version,))
+            self._db.commit()
+
+    def _remember(self, key, result):
+        self._lru[key] = result
+        self._lru.move_to_end(key)
+        if len(self._lru) > self.size:
+            self._lru.popitem(last=False)
+
+    def get(self, key):
+        # The cached QA2DResult for key, or None
+        with self._lock:
+            result = self._lru.get(key)
+            if result is not None:
+                self._lru.move_to_end(key)
+                self.hits['memory'] += 1
+                return result
+            if self._db is not None:
+                row = self._db.execute('SELECT status, declr, type, answer_pos FROM results WHERE key = ?',
+                                       (key,)).fetchone()
+                if row is not None:
+                    result = QA2DResult(row[0], None if row[1] is None else json.loads(row[1]), row[2], row[3])
+                    self._remember(key, result)
+                    self.hits['disk'] += 1
+                    return result
+            self.misses += 1
+            return None
+
+    def put(self, key, result):
+        with self._lock:
+            self._remember(key, result)
+            if self._db is not None:
+                self._pending.append((key, result.status, None if result.declr is None else json.dumps(result.declr),
+                                      result.type, result.answer_pos))
+                if len(self._pending) >= self.commit_every:
+                    self._commit()
+
+    def _commit(self):
+        self._db.executemany('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)', self._pending)
+        self._db.commit()
+        self._pending = []
+
+    def flush(self):
+        with self._lock:
+            if self._db is not None and len(self._pending) > 0:
+                self._commit()
+
+    def close(self):
+        self.flush()
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def lookup(self, items):
+        # Passes (key, item) pairs through, replacing the pairs that are cached by their QA2DResult.
+        # Together with store, which has to see the results in the same order:
+        #   cache.store(converted(cache.lookup(items)))
+        # Keys are queued between the two, so they can run in different threads.
+        for position, item in items:
+            if isinstance(item, QA2DResult):
+                self._keys.append(None)
+                yield position, item
+                continue
+            key = pair_key(item[0], item[1])
+            result = self.get(key)
+            if result is None:
+                self._keys.append(key)
+                yield position, item
+            else:
+                self._keys.append(None)
+                count_result(result, 'cache')
+                yield position, result
+
+    def store(self, results):
+        # Caches the results of the pairs lookup did not find, and passes everything through
+        for position, result in results:
+            key = self._keys.popleft()
+            if key is not None:
+                self.put(key, result)
+            yield position, result
+
+    def report(self):
+        return {'memory_hits': self.hits['memory'], 'disk_hits': self.hits['disk'], 'misses': self.misses}
@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+import json
+import mmap
+import os
+import shutil
+import sys
+import tempfile
+from array import array
+
+from rule import Token, token_columns
+
+# Binary columnar corpus. Layout: MAGIC, then the columns one after the other (each padded to 8 bytes),
+# then a JSON footer with the vocabularies and the position of every column, then the footer length
+# as 8 little-endian bytes. Heads are stored as in CoNLL-U (1-based, 0 for the root), and a missing
+# head ('_', None) as MISSING_HEAD.
+MAGIC = b'QA2DBIN1'
+COLUMNS = [('offsets', 'q'), ('form', 'i'), ('upostag', 'i'), ('xpostag', 'i'), ('head', 'i'), ('deprel', 'i')]
+VOCAB_COLUMNS = ['form', 'upostag', 'xpostag', 'deprel']
+FLUSH_EVERY = 1 << 20
+MISSING_HEAD = -1
+
+
+def is_binary_corpus(path):
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def write_corpus(sentences, path):
+    # Streams the sentences into per-column temporary files, then assembles the corpus file
+    vocab = dict((c, {}) for c in VOCAB_COLUMNS)
+    tmpdir = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        buffers = dict((name, array(code)) for name, code in COLUMNS)
+        files = dict((name, open(os.path.join(tmpdir, name), 'wb')) for name, _ in COLUMNS)
+
+        def flush():
+            for name, buf in buffers.items():
+                buf.tofile(files[name])
+                del buf[:]
+
+        n_tokens = 0
+        n_sentences = 0
+        buffers['offsets'].append(0)
+        for sent in sentences:
+            for tok in sent:
+                form, upostag, xpostag, head, deprel = token_columns(tok)
+                for name, s in (('form', form), ('upostag', upostag), ('xpostag', xpostag), ('deprel', deprel)):
+                    ids = vocab[name]
+                    i = ids.get(s)
+                    if i is None:
+                        i = ids[s] = len(ids)
+                    buffers[name].append(i)
+                buffers['head'].append(MISSING_HEAD if head is None else head)
+                n_tokens += 1
+            buffers['offsets'].append(n_tokens)
+            n_sentences += 1
+            if len(buffers['form']) >= FLUSH_EVERY:
+                flush()
+        flush()
+        for f in files.values():
+            f.close()
+
+        footer = {'sentences': n_sentences, 'tokens': n_tokens, 'columns': {},
+                  'vocab': dict((c, sorted(ids, key=ids.get)) for c, ids in vocab.items())}
+        with open(path + '.tmp', 'wb') as out:
+            out.write(MAGIC)
+            for name, code in COLUMNS:
+                start = out.tell()
+                with open(os.path.join(tmpdir, name), 'rb') as f:
+                    shutil.copyfileobj(f, out)
+                footer['columns'][name] = [code, start, out.tell() - start]
+                out.write(b'\0' * (-out.tell() % 8))
+            data = json.dumps(footer).encode('utf-8')
+            out.write(data)
+            out.write(len(data).to_bytes(8, 'little'))
+        os.replace(path + '.tmp', path)
+    finally:
+        shutil.rmtree(tmpdir)
+    return n_sentences
+
+
+class SentenceView(object):
+    # One sentence of a Corpus. Indexing or iterating creates fresh Token objects from the columns,
+    # so Question and AnswerSpan can consume a view directly.
+    __slots__ = ('corpus', 'index', 'start', 'stop')
+
+    def __init__(self, corpus, index):
+        self.corpus = corpus
+        self.index = index
+        self.start = corpus.offsets[index]
+        self.stop = corpus.offsets[index + 1]
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('token index out of range')
+        return self.corpus.token(self.start + i)
+
+    def __iter__(self):
+        token = self.corpus.token
+        for i in range(self.start, self.stop):
+            yield token(i)
+
+    def columns(self):
+        # (form, upostag, xpostag, head, deprel) of every token, without creating Tokens
+        c = self.corpus
+        form, upostag, xpostag, deprel = (c.vocab[name] for name in ('form', 'upostag', 'xpostag', 'deprel'))
+        get_head = c.get_head
+        return [(form[c.form[i]], upostag[c.upostag[i]], xpostag[c.xpostag[i]], get_head(i), deprel[c.deprel[i]])
+                for i in range(self.start, self.stop)]
+
+    def __reduce__(self):
+        return SentenceView, (self.corpus, self.index)
+
+
+_open_corpora = {}
+
+
+class Corpus(object):
+    # Read-only, memory-mapped corpus written by write_corpus. The columns are memoryviews of the
+    # mapping, so processes reading the same file share its pages. Pickling a Corpus (or a view of it)
+    # only sends the path; each process maps the file once.
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        with open(self.path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        buf = memoryview(self._mmap)
+        if buf[:len(MAGIC)] != MAGIC:
+            raise ValueError('{} is not a binary QA2D corpus'.format(path))
+        footer_len = int.from_bytes(buf[-8:], 'little')
+        footer = json.loads(bytes(buf[-8 - footer_len:-8]).decode('utf-8'))
+        self.n_sentences = footer['sentences']
+        self.n_tokens = footer['tokens']
+        self.vocab = footer['vocab']
+        for c in VOCAB_COLUMNS:
+            self.vocab[c] = [sys.intern(s) if s is not None else None for s in self.vocab[c]]
+        for name, (code, start, length) in footer['columns'].items():
+            setattr(self, name, buf[start:start + length].cast(code))
+
+    @classmethod
+    def open(cls, path):
+        path = os.path.abspath(path)
+        if path not in _open_corpora:
+            _open_corpora[path] = cls(path)
+        return _open_corpora[path]
+
+    def __reduce__(self):
+        return Corpus.open, (self.path,)
+
+    def __len__(self):
+        return self.n_sentences
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self.n_sentences
+        if not 0 <= i < self.n_sentences:
+            raise IndexError('sentence index out of range')
+        return SentenceView(self, i)
+
+    def get_head(self, i):
+        head = self.head[i]
+        return None if head == MISSING_HEAD else head
+
+    def token(self, i):
+        vocab = self.vocab
+        return Token(vocab['form'][self.form[i]], vocab['upostag'][self.upostag[i]],
+                     vocab['xpostag'][self.xpostag[i]], self.get_head(i), vocab['deprel'][self.deprel[i]])
+
+    def pairs(self, start=0, stop=None):
+        # (question, answer) views of pairs start to stop - 1
+        if stop is None:
+            stop = self.n_sentences // 2
+        for n in range(start, stop):
+            yield SentenceView(self, 2 * n), SentenceView(self, 2 * n + 1)
+
+    def shard(self):
+        # The whole corpus as a features.Shard of NumPy views (no copy), for vectorized features
+        import numpy as np
+        from features import Shard, Vocab
+
+        vocab = Vocab()
+        for c in VOCAB_COLUMNS:
+            for s in self.vocab[c]:
+                vocab.id(c, s)
+        return Shard(*[np.frombuffer(getattr(self, name), dtype=np.int64 if code == 'q' else np.int32)
+                       for name, code in COLUMNS], vocab=vocab)
+
+
+def main(argv=None):
+    import argparse
+    from qa2d import open_input
+    from reader import iter_sentences
+
+    parser = argparse.ArgumentParser(description='Convert a CoNLL-U file to the binary columnar corpus format.')
+    parser.add_argument('input', help='CoNLL-U file (- for stdin)')
+    parser.add_argument('-o', '--output', required=True, help='binary corpus to write')
+    args = parser.parse_args(argv)
+    with open_input(args.input) as f:
+        n = write_corpus(iter_sentences(f), args.output)
+    sys.stderr.write('Wrote {} sentences to {}\n'.format(n, args.output))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+# Detokenizer for the PTB-style token streams that Question.format_declr returns.
+# A single pass with set lookups, no regular expressions.
+
+BRACKETS = {'-LRB-': '(', '-RRB-': ')', '-LSB-': '[', '-RSB-': ']', '-LCB-': '{', '-RCB-': '}'}
+# Attach to the previous token
+ATTACH_LEFT = frozenset([',', '.', '!', '?', ';', ':', '%', ')', ']', '}', "''", '...'])
+# The next token attaches to these
+ATTACH_RIGHT = frozenset(['(', '[', '{', '$', '#', '``'])
+CLITICS = frozenset(["'s", "'re", "'ve", "'ll", "'d", "'m", "n't", "'"])
+QUOTES = {'``': '"', "''": '"'}
+
+
+def detokenize(words):
+    out = []
+    space = False
+    quote_open = False
+    for word in words:
+        word = BRACKETS.get(word, word)
+        if word == '"':
+            # Straight quotes alternate between opening and closing
+            if quote_open:
+                out.append(word)
+                space = True
+            else:
+                if space:
+                    out.append(' ')
+                out.append(word)
+                space = False
+            quote_open = not quote_open
+            continue
+        if space and word not in ATTACH_LEFT and word.lower() not in CLITICS:
+            out.append(' ')
+        out.append(QUOTES.get(word, word))
+        space = word not in ATTACH_RIGHT
+    return ''.join(out)
@@ -0,0 +1,494 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+import argparse
+import json
+import os
+import socket
+import sys
+import threading
+import time
+import uuid
+
+import verbs
+from corpus import is_binary_corpus
+
+# Conversion of one input by any number of worker processes on any number of hosts, coordinated
+# through a shared directory only. The job directory holds:
+#
+#   job.json                the input (with its size and modification time), the conversion options
+#                           and the shards: contiguous ranges of pairs, with the input offset of the first
+#   leases/00003.lease      the lease of a shard being converted, created with O_EXCL by the worker that
+#                           claims it and touched by that worker, through the file it keeps open, while
+#                           it converts the shard
+#   shards/00003.txt        the output of a finished shard (.jsonl with --format jsonl), renamed into
+#                           place after it was synced, next to 00003.json with its counts
+#   tmp/                    shard outputs being written
+#   workers/<worker>        touched by every worker; its modification time is the clock of the shared
+#                           file system, which leases are compared with (so host clocks need not agree)
+#
+# A lease whose modification time is more than the lease time in the past belongs to a dead worker, or
+# to one that stalled for that long. It is renamed away (only one of the workers trying succeeds) and
+# the shard is claimed again. The renamed file is checked again and put back if it turns out to be a
+# fresh lease, which another worker created after rescuing the shard first, or which its owner touched
+# in the meantime. A worker whose lease was taken over drops its output of the shard. The
+# conversion is deterministic, so a shard that ends up converted twice gives the same output twice.
+# merge concatenates the shards in order, so the result is the same as the output of a single qa2d run.
+
+JOB = 'job.json'
+
+
+def _shard_name(n):
+    return '{:05d}'.format(n)
+
+
+def _write_json(path, obj):
+    tmp = '{}.{}.tmp'.format(path, uuid.uuid4().hex)
+    with open(tmp, 'w') as f:
+        json.dump(obj, f, indent=2, sort_keys=True)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _read_json(path):
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def split(path, shard_size):
+    # Shards of shard_size pairs: (first pair, pair after the last, input offset of the first pair)
+    if is_binary_corpus(path):
+        from corpus import Corpus
+        n = len(Corpus.open(path)) // 2
+        return [(start, min(start + shard_size, n), start) for start in range(0, n, shard_size)]
+    from offsets import load_index, scan
+    # Without writing an index next to the input
+    offsets = load_index(path)
+    if offsets is None:
+        with open(path, 'rb') as f:
+            offsets = scan(f)
+    n = len(offsets) - 1
+    return [(start, min(start + shard_size, n), offsets[start]) for start in range(0, n, shard_size)]
+
+
+def init_job(jobdir, input_path, shard_size=100000, fmt='text', tokenized=False, prefilter=False, lease=300.0):
+    # Creates the job directory and returns the job
+    if os.path.exists(os.path.join(jobdir, JOB)):
+        raise ValueError('{} already holds a job'.format(jobdir))
+    input_path = os.path.abspath(input_path)
+    st = os.stat(input_path)
+    shards = split(input_path, shard_size)
+    job = {'input': input_path, 'size': st.st_size, 'mtime_ns': st.st_mtime_ns,
+           'pairs': shards[-1][1] if len(shards) > 0 else 0, 'format': fmt, 'tokenized': tokenized,
+           'prefilter': prefilter, 'lease_s': lease,
+           'shards': [{'start': start, 'stop': stop, 'offset': offset} for start, stop, offset in shards]}
+    for sub in ('leases', 'shards', 'tmp', 'workers'):
+        os.makedirs(os.path.join(jobdir, sub), exist_ok=True)
+    _write_json(os.path.join(jobdir, JOB), job)
+    return job
+
+
+class Job(object):
+    def __init__(self, jobdir):
+        self.dir = jobdir
+        self.job = _read_json(os.path.join(jobdir, JOB))
+        self.shards = self.job['shards']
+        self.suffix = '.jsonl' if self.job['format'] == 'jsonl' else '.txt'
+
+    def lease_path(self, n):
+        return os.path.join(self.dir, 'leases', _shard_name(n) + '.lease')
+
+    def output_path(self, n):
+        return os.path.join(self.dir, 'shards', _shard_name(n) + self.suffix)
+
+    def counts_path(self, n):
+        return os.path.join(self.dir, 'shards', _shard_name(n) + '.json')
+
+    def is_done(self, n):
+        return os.path.exists(self.output_path(n))
+
+    def pending(self):
+        return [n for n in range(len(self.shards)) if not self.is_done(n)]
+
+    def check_input(self, path):
+        st = os.stat(path)
+        if st.st_size != self.job['size'] or st.st_mtime_ns != self.job['mtime_ns']:
+            raise ValueError('{} changed since the job was created'.format(path))
+
+
+class Worker(object):
+    # Claims pending shards of a job one at a time and converts them until every shard is done
+    def __init__(self, job, input_path=None, workers=1, chunksize=64, poll=None, log=sys.stderr):
+        self.job = job
+        self.input = input_path or job.job['input']
+        self.workers = workers
+        self.chunksize = chunksize
+        self.lease_s = job.job['lease_s']
+        self.poll = poll or min(self.lease_s / 4, 1.0)
+        self.log = log
+        self.id = '{}-{}-{}'.format(socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8])
+        self.alive_path = os.path.join(job.dir, 'workers', self.id)
+        self.converted = []
+        self.rescued = []
+        # Open file of every lease this worker holds: touching it renews this lease and no other, even
+        # if the lease was renamed or replaced in the meantime
+        self._leases = {}
+
+    def _say(self, msg):
+        self.log.write('{}: {}\n'.format(self.id, msg))
+        self.log.flush()
+
+    def now(self):
+        # The current time of the shared file system, from the worker's own heartbeat file
+        with open(self.alive_path, 'a'):
+            os.utime(self.alive_path)
+        return os.stat(self.alive_path).st_mtime
+
+    def _owner(self, n, path=None):
+        # The worker recorded in the lease of shard n (or in the lease file at path)
+        try:
+            with open(path or self.job.lease_path(n), 'r') as f:
+                return json.load(f).get('worker')
+        except (OSError, ValueError):
+            return None
+
+    def _create_lease(self, n):
+        try:
+            fd = os.open(self.job.lease_path(n), os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            return False
+        os.write(fd, json.dumps({'worker': self.id, 'shard': n}).encode('utf-8'))
+        os.fsync(fd)
+        self._leases[n] = fd
+        return True
+
+    def holds(self, n):
+        # Whether the lease of shard n is still the one this worker created
+        fd = self._leases.get(n)
+        try:
+            return fd is not None and os.stat(self.job.lease_path(n)).st_ino == os.fstat(fd).st_ino
+        except FileNotFoundError:
+            return False
+
+    def _rescue(self, n):
+        # Removes the lease of shard n if it expired; only one of the workers trying succeeds.
+        # The lease is renamed to a name of this attempt first, and only then checked again: if another
+        # worker rescued the shard and claimed it in the meantime, the renamed file is its fresh lease,
+        # which is put back. Only the files of the owner recorded in the expired lease are removed.
+        lease = self.job.lease_path(n)
+        try:
+            expired = os.stat(lease).st_mtime + self.lease_s < self.now()
+        except FileNotFoundError:
+            return True
+        if not expired:
+            return False
+        owner = self._owner(n)
+        stale = '{}.{}.expired'.format(lease, uuid.uuid4().hex)
+        try:
+            os.rename(lease, stale)
+        except FileNotFoundError:
+            return False
+        try:
+            renamed_expired = os.stat(stale).st_mtime + self.lease_s < self.now()
+        except FileNotFoundError:
+            return False
+        renamed_owner = self._owner(n, stale)
+        if not renamed_expired or renamed_owner != owner:
+            try:
+                # Unlike a rename, a link does not replace a lease created since
+                os.link(stale, lease)
+            except FileExistsError:
+                pass
+            os.remove(stale)
+            return False
+        os.remove(stale)
+        self._say('lease of shard {} held by {} expired'.format(n, owner))
+        self.rescued.append(n)
+        if owner is not None:
+            # What the dead worker left behind
+            for path in (os.path.join(self.job.dir, 'tmp', '{}.{}{}'.format(_shard_name(n), owner, self.job.suffix)),
+                         os.path.join(self.job.dir, 'workers', owner)):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+        return True
+
+    def claim(self, n):
+        if self.job.is_done(n):
+            return False
+        if not self._create_lease(n):
+            if not self._rescue(n) or not self._create_lease(n):
+                return False
+        if self.job.is_done(n):
+            # Finished by the worker whose lease was just released
+            self.release(n)
+            return False
+        return True
+
+    def release(self, n):
+        if self.holds(n):
+            try:
+                os.remove(self.job.lease_path(n))
+            except FileNotFoundError:
+                pass
+        fd = self._leases.pop(n, None)
+        if fd is not None:
+            os.close(fd)
+
+    def _heartbeat(self, n, stop):
+        # Touches the lease file itself rather than the path, which may name the lease of another worker
+        # by now; the rescue of a lease touched this way is undone (see _rescue)
+        while not stop.wait(self.lease_s / 4):
+            self.now()
+            os.utime(self._leases[n])
+
+    def convert_shard(self, n):
+        # Writes the output of shard n to a temporary file and renames it into place once it is synced.
+        # Returns False, leaving the shard to the worker that took it over, if this worker lost its lease
+        # in the meantime (the temporary file is then removed by that worker, or here).
+        from qa2d import convert, write_records, write_results
+        from writer import JsonlWriter
+
+        shard = self.job.shards[n]
+        job = self.job.job
+        state = {'input_offset': shard['offset'], 'next_index': shard['start'], 'written': 0, 'counts': {}}
+        tmp = os.path.join(self.job.dir, 'tmp', '{}.{}{}'.format(_shard_name(n), self.id, self.job.suffix))
+        results = convert(self.input, state, workers=self.workers, chunksize=self.chunksize,
+                          prefilter=job['prefilter'], stop=shard['stop'])
+        try:
+            if job['format'] == 'jsonl':
+                with JsonlWriter(tmp) as out:
+                    write_records(results, out, state, tokenized=job['tokenized'])
+                    out.flush()
+                    os.fsync(out.fileno())
+            else:
+                # The skipped pairs are only counted
+                with open(tmp, 'wb') as out, open(os.devnull, 'w') as log:
+                    write_results(results, out, state, log=log, tokenized=job['tokenized'])
+                    out.flush()
+                    os.fsync(out.fileno())
+            if state['written'] != shard['stop'] - shard['start']:
+                raise ValueError('shard {} has {} pairs, expected {}'.format(n, state['written'],
+                                                                           shard['stop'] - shard['start']))
+        except BaseException:
+            self._remove_tmp(tmp)
+            raise
+        if not self.holds(n):
+            self._remove_tmp(tmp)
+            return False
+        _write_json(self.job.counts_path(n), {'pairs': state['written'], 'counts': state['counts'],
+                                              'worker': self.id})
+        try:
+            os.replace(tmp, self.job.output_path(n))
+        except FileNotFoundError:
+            # Removed by the worker that took the shard over, after the check above
+            return False
+        return True
+
+    @staticmethod
+    def _remove_tmp(tmp):
+        try:
+            os.remove(tmp)
+        except FileNotFoundError:
+            pass
+
+    def run(self, max_shards=None):
+        # Converts shards until none is pending (or max_shards were converted); returns the shards converted
+        self.job.check_input(self.input)
+        self.now()
+        try:
+            while max_shards is None or len(self.converted) < max_shards:
+                pending = self.job.pending()
+                if len(pending) == 0:
+                    break
+                # Start at a different shard in every worker, so they do not all race for the same lease
+                start = hash(self.id) % len(pending)
+                claimed = None
+                for n in pending[start:] + pending[:start]:
+                    if self.claim(n):
+                        claimed = n
+                        break
+                if claimed is None:
+                    # The pending shards are all leased by live workers
+                    time.sleep(self.poll)
+                    continue
+                self._say('converting shard {} (pairs {} to {})'.format(
+                    claimed, self.job.shards[claimed]['start'], self.job.shards[claimed]['stop'] - 1))
+                stop = threading.Event()
+                heartbeat = threading.Thread(target=self._heartbeat, args=(claimed, stop))
+                heartbeat.daemon = True
+                heartbeat.start()
+                try:
+                    converted = self.convert_shard(claimed)
+                finally:
+                    stop.set()
+                    heartbeat.join()
+                    self.release(claimed)
+                if converted:
+                    self.converted.append(claimed)
+                else:
+                    self._say('lease of shard {} was taken over, dropping its output'.format(claimed))
+        finally:
+            try:
+                os.remove(self.alive_path)
+            except FileNotFoundError:
+                pass
+        return self.converted
+
+
+def status(job):
+    leased = [n for n in range(len(job.shards))
+              if not job.is_done(n) and os.path.exists(job.lease_path(n))]
+    done = len(job.shards) - len(job.pending())
+    # Seconds since every worker was last seen, by the clock of this host
+    workers = {}
+    for name in sorted(os.listdir(os.path.join(job.dir, 'workers'))):
+        try:
+            workers[name] = round(time.time() - os.stat(os.path.join(job.dir, 'workers', name)).st_mtime, 1)
+        except FileNotFoundError:
+            pass
+    return {'shards': len(job.shards), 'done': done, 'leased': leased,
+            'pending': len(job.shards) - done - len(leased), 'last_seen_s': workers}
+
+
+def merge(job, output):
+    # Concatenates the shard outputs in order into output and returns the summed counts
+    pending = job.pending()
+    if len(pending) > 0:
+        raise ValueError('{} of {} shards are not done, e.g. shard {}'.format(len(pending), len(job.shards),
+                                                                              pending[0]))
+    counts = {}
+    tmp = '{}.{}.tmp'.format(output, uuid.uuid4().hex)
+    with open(tmp, 'wb') as out:
+        for n, shard in enumerate(job.shards):
+            info = _read_json(job.counts_path(n))
+            if info['pairs'] != shard['stop'] - shard['start']:
+                raise ValueError('shard {} has {} pairs, expected {}'.format(n, info['pairs'],
+                                                                           shard['stop'] - shard['start']))
+            for status, count in info['counts'].items():
+                counts[status] = counts.get(status, 0) + count
+            with open(job.output_path(n), 'rb') as f:
+                while True:
+                    block = f.read(1 << 20)
+                    if not block:
+                        break
+                    out.write(block)
+        out.flush()
+        os.fsync(out.fileno())
+    os.replace(tmp, output)
+    return counts
+
+
+def _format_counts(counts):
+    return ', '.join('{} {}'.format(v, k) for k, v in sorted(counts.items()))
+
+
+def run_init(args):
+    try:
+        job = init_job(args.jobdir, args.input, args.shard_size, args.format, args.tokenized, args.prefilter,
+                       args.lease)
+    except ValueError as e:
+        sys.exit(str(e))
+    sys.stderr.write('{} pairs in {} shards\n'.format(job['pairs'], len(job['shards'])))
+    return 0
+
+
+def run_work(args):
+    # Warns here, once, if verbs fall back to the regular rules, rather than in every worker
+    verbs.has_pattern()
+    worker = Worker(Job(args.jobdir), args.input, args.workers or None, args.chunksize)
+    try:
+        converted = worker.run(args.max_shards)
+    except ValueError as e:
+        sys.exit(str(e))
+    sys.stderr.write('{}: converted {} shard(s)\n'.format(worker.id, len(converted)))
+    return 0
+
+
+def run_status(args):
+    print(json.dumps(status(Job(args.jobdir)), indent=2))
+    return 0
+
+
+def run_merge(args):
+    try:
+        counts = merge(Job(args.jobdir), args.output)
+    except ValueError as e:
+        sys.exit(str(e))
+    sys.stderr.write('Done: {}\n'.format(_format_counts(counts)))
+    return 0
+
+
+def run_local(args):
+    # The whole job on this machine, with args.nodes worker processes standing for the hosts
+    import subprocess
+
+    if not os.path.exists(os.path.join(args.jobdir, JOB)):
+        init_job(args.jobdir, args.input, args.shard_size, args.format, args.tokenized, args.prefilter, args.lease)
+    # The warning about the verbs is given here, not by every worker process
+    verbs.has_pattern()
+    cmd = [sys.executable, '-W', 'ignore:{}:RuntimeWarning'.format(verbs.NO_PATTERN_WARNING),
+           os.path.abspath(__file__), 'work', args.jobdir, '--chunksize', str(args.chunksize)]
+    procs = [subprocess.Popen(cmd) for _ in range(args.nodes)]
+    failed = [p.args for p in procs if p.wait() != 0]
+    if len(failed) > 0:
+        sys.exit('{} worker(s) failed'.format(len(failed)))
+    return run_merge(args)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Convert a file with many worker processes on many hosts, '
+                                                 'coordinated through a shared directory.')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    def job_options(p):
+        p.add_argument('--shard-size', type=int, default=100000, metavar='N',
+                       help='pairs per shard (default: %(default)s)')
+        p.add_argument('--format', choices=['text', 'jsonl'], default='text', help='as for qa2d.py')
+        p.add_argument('--tokenized', action='store_true', help='as for qa2d.py')
+        p.add_argument('--prefilter', action='store_true', help='as for qa2d.py (needs numpy)')
+        p.add_argument('--lease', type=float, default=300.0, metavar='SECONDS',
+                       help='a shard whose worker showed no sign of life for this long is converted again '
+                            '(default: %(default)s)')
+
+    p = subparsers.add_parser('init', help='split the input into shards in a new job directory')
+    p.add_argument('jobdir')
+    p.add_argument('input', help='CoNLL-U file or binary corpus, at a path every host can read')
+    job_options(p)
+    p.set_defaults(func=run_init)
+
+    p = subparsers.add_parser('work', help='convert pending shards until the job is done')
+    p.add_argument('jobdir')
+    p.add_argument('--input', help='path of the input on this host, if it differs from the one in the job')
+    p.add_argument('-j', '--workers', type=int, default=1,
+                   help='worker processes for this node (default: 1, 0 for one per CPU)')
+    p.add_argument('--chunksize', type=int, default=64)
+    p.add_argument('--max-shards', type=int, metavar='N', help='stop after converting N shards')
+    p.set_defaults(func=run_work)
+
+    p = subparsers.add_parser('status', help='show the shards that are done, leased and pending')
+    p.add_argument('jobdir')
+    p.set_defaults(func=run_status)
+
+    p = subparsers.add_parser('merge', help='concatenate the shard outputs in order')
+    p.add_argument('jobdir')
+    p.add_argument('-o', '--output', required=True)
+    p.set_defaults(func=run_merge)
+
+    p = subparsers.add_parser('local', help='create the job, run NODES workers on this machine and merge')
+    p.add_argument('jobdir')
+    p.add_argument('input')
+    p.add_argument('-o', '--output', required=True)
+    p.add_argument('--nodes', type=int, default=4, help='worker processes (default: %(default)s)')
+    p.add_argument('--chunksize', type=int, default=64)
+    job_options(p)
+    p.set_defaults(func=run_local)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
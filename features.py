@@ -0,0 +1,248 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+from collections import defaultdict, namedtuple
+from itertools import chain, count, islice
+from operator import itemgetter
+
+import numpy as np
+
+from corpus import MISSING_HEAD
+from rule import (Token, QA2DResult, QUESTION_FEATURES, INVALID_QUESTION, INVALID_ANSWER, TIME_WORDS, VERB_UPOS,
+                  alpha, count_result)
+
+# A shard of sentences as flat arrays: the tokens of sentence i are offsets[i]:offsets[i + 1].
+# form/upostag/xpostag/deprel are ids into the vocab lists; head is as in CoNLL-U, MISSING_HEAD for '_'
+# (the features only look for missing heads).
+Shard = namedtuple('Shard', ['offsets', 'form', 'upostag', 'xpostag', 'head', 'deprel', 'vocab'])
+
+# The results of the verdict codes of invalid_pairs; None (code 0) means the pair needs converting
+VERDICTS = (None, QA2DResult(INVALID_QUESTION), QA2DResult(INVALID_ANSWER))
+
+
+class Vocab(object):
+    # One string <-> id table per column
+    COLUMNS = ('form', 'upostag', 'xpostag', 'deprel')
+
+    def __init__(self):
+        # The id of a new string is the next number: the ids of a column are the indices of its strings
+        self.ids = dict((c, defaultdict(count().__next__)) for c in self.COLUMNS)
+        self.strings = dict((c, []) for c in self.COLUMNS)
+
+    def id(self, column, s):
+        i = self.ids[column][s]
+        if i == len(self.strings[column]):
+            self.strings[column].append(s)
+        return i
+
+    def encode(self, column, strings, n):
+        # Id array of n strings, adding the new ones
+        ids = self.ids[column]
+        known = self.strings[column]
+        encoded = np.fromiter(map(ids.__getitem__, strings), dtype=np.int32, count=n)
+        if len(ids) > len(known):
+            known.extend(islice(ids, len(known), None))
+        return encoded
+
+    def get(self, column, s):
+        return self.ids[column].get(s, -1)
+
+    def table(self, column, predicate):
+        # Boolean array over the ids of column, for indexing with an id array
+        # (a missing value, None, matches nothing)
+        return np.array([s is not None and bool(predicate(s)) for s in self.strings[column]] + [False],
+                        dtype=bool)
+
+
+def load_shard(sentences, vocab=None):
+    # Sentences of column rows (see reader.parse_columns) to a Shard. The columns are encoded one at a
+    # time, without a Python loop over the tokens.
+    if vocab is None:
+        vocab = Vocab()
+    offsets = np.zeros(len(sentences) + 1, dtype=np.int64)
+    np.cumsum([len(sent) for sent in sentences], out=offsets[1:])
+    rows = list(chain.from_iterable(sentences))
+    form, upostag, xpostag, deprel = [vocab.encode(name, map(itemgetter(i), rows), len(rows))
+                                      for i, name in ((0, 'form'), (1, 'upostag'), (2, 'xpostag'), (4, 'deprel'))]
+    head = np.fromiter((MISSING_HEAD if h is None else h for h in map(itemgetter(3), rows)), dtype=np.int32,
+                       count=len(rows))
+    return Shard(offsets, form, upostag, xpostag, head, deprel, vocab)
+
+
+def question_features(shard):
+    # The positional predicates of Question for every sentence of the shard at once.
+    # maybe_valid is exact for n_wh <= 1 (Question._get_wh picks among several wh-words by looking at
+    # their heads) and never False for a question Question accepts. The other features are those of
+    # the first wh-word and are the same as Question's where exact is True: the sentence has exactly one
+    # wh-word, and no empty or missing xpostag, on which Question._lastword_idx fails.
+    # Question fails on a missing xpostag, head or deprel anywhere in the sentence; such a sentence is
+    # incomplete, and neither maybe_valid nor the other features say anything about it.
+    vocab = shard.vocab
+    n = shard.offsets.size - 1
+    starts, ends = shard.offsets[:-1], shard.offsets[1:]
+    sent = np.repeat(np.arange(n), np.diff(shard.offsets))
+
+    is_verb = vocab.table('xpostag', lambda s: s.startswith('V') or s == 'MD')[shard.xpostag] \
+        | vocab.table('upostag', lambda s: s in VERB_UPOS)[shard.upostag]
+    is_root = shard.deprel == vocab.get('deprel', 'root')
+    is_wh = vocab.table('xpostag', lambda s: s.startswith('W'))[shard.xpostag] \
+        & (shard.form != vocab.get('form', 'that'))
+    is_word = vocab.table('xpostag', lambda s: len(s) > 0 and s[0] in alpha and s != 'SYM')[shard.xpostag]
+    missing_xpostag = shard.xpostag == vocab.get('xpostag', None)
+    is_empty = (shard.xpostag == vocab.get('xpostag', '')) | missing_xpostag
+    is_missing = missing_xpostag | (shard.head == MISSING_HEAD) | (shard.deprel == vocab.get('deprel', None))
+
+    has_root = np.bincount(sent[is_root], minlength=n) > 0
+    has_verb = np.bincount(sent[is_verb], minlength=n) > 0
+    n_wh = np.bincount(sent[is_wh], minlength=n)
+    incomplete = np.bincount(sent[is_missing], minlength=n) > 0
+
+    # Flat index of the first wh-word of every sentence, and of its next token if the sentence has one
+    wh_flat = np.flatnonzero(is_wh)
+    wh_tok = wh_flat[np.minimum(np.searchsorted(wh_flat, starts), max(wh_flat.size - 1, 0))] \
+        if wh_flat.size else np.zeros(n, dtype=np.int64)
+    has_wh = n_wh > 0
+    has_next = has_wh & (wh_tok + 1 < ends)
+    form = np.append(shard.form, -1)
+    wh_form = form[np.where(has_wh, wh_tok, -1)]
+    next_form = form[np.where(has_next, wh_tok + 1, -1)]
+
+    # The lowercased wh-words, looked up only for the few forms that are wh-words
+    strings = vocab.strings['form']
+    lower = dict((i, strings[i].lower()) for i in np.unique(wh_form[has_wh]).tolist())
+
+    def wh_in(words):
+        return np.isin(wh_form, [i for i, w in lower.items() if w in words])
+
+    def next_in(words):
+        return np.isin(next_form, [i for i in (vocab.get('form', w) for w in words) if i >= 0])
+
+    # Position of the last token with a word tag, 0 if there is none
+    word_flat = np.flatnonzero(is_word)
+    last = np.searchsorted(word_flat, ends) - 1
+    last_word = word_flat[np.maximum(last, 0)] if word_flat.size else np.zeros(n, dtype=np.int64)
+    has_word = (last >= 0) & (last_word >= starts)
+
+    return {
+        'has_root': has_root,
+        'has_verb': has_verb,
+        'n_wh': n_wh,
+        'incomplete': incomplete,
+        'maybe_valid': has_root & has_verb & has_wh,
+        'wh_idx': np.where(has_wh, wh_tok - starts, -1),
+        'wh_is_quantity': has_next & wh_in(['how']) & next_in(['many', 'much']),
+        'wh_is_time': has_next & wh_in(['what', 'which']) & next_in(TIME_WORDS),
+        'wh_is_happened': has_next & wh_in(['what']) & next_in(['happened']),
+        'lastword_idx': np.where(has_word, last_word - starts, 0),
+        'exact': (n_wh == 1) & ~incomplete & (np.bincount(sent[is_empty], minlength=n) == 0),
+    }
+
+
+def feature_rows(q_features, start=0, stop=None):
+    # For the sentences start:stop, the dict of QUESTION_FEATURES to give to Question, or None where
+    # they are not exact
+    columns = [q_features[name][start:stop].tolist() for name in QUESTION_FEATURES]
+    return [dict(zip(QUESTION_FEATURES, values)) if exact else None
+            for exact, values in zip(q_features['exact'][start:stop].tolist(), zip(*columns))]
+
+
+def answer_valid(shard):
+    # AnswerSpan.isvalid: something is left after dropping a final punctuation token. A punctuation
+    # token without a head counts as valid, as AnswerSpan fails on it.
+    lengths = np.diff(shard.offsets)
+    last_tok = np.maximum(shard.offsets[1:] - 1, 0)
+    last = shard.upostag[last_tok] if shard.upostag.size else lengths
+    ends_in_punct = (lengths > 0) & (last == shard.vocab.get('upostag', 'PUNCT'))
+    if shard.head.size:
+        ends_in_punct &= shard.head[last_tok] != MISSING_HEAD
+    return lengths - ends_in_punct > 0
+
+
+def _verdicts(q_features, a_valid):
+    # An incomplete question is left to Question, which fails on it
+    incomplete = q_features['incomplete']
+    q_valid = q_features['maybe_valid'] | incomplete
+    q_exact = (q_features['n_wh'] == 1) & ~incomplete
+    return np.where(~q_valid, 1, np.where(q_exact & ~a_valid, 2, 0)).astype(np.int8)
+
+
+def _invalid_reasons(q_features, i):
+    # Question.invalid_reasons of question i, whose verdict is 1
+    reasons = []
+    if not q_features['has_root'][i]:
+        reasons.append('no_root')
+    if not q_features['has_verb'][i]:
+        reasons.append('no_verb')
+    if q_features['n_wh'][i] == 0:
+        reasons.append('no_wh')
+    return reasons
+
+
+def _count_verdict(code, q_features, i):
+    # Counts the verdict of pair i in the profile, as qa2d would have (qa2d_batch passes it through)
+    count_result(VERDICTS[code], 'prefilter', _invalid_reasons(q_features, i) if code == 1 else ())
+
+
+def _answers_valid(answers):
+    # answer_valid of a list of answers (column rows)
+    return np.array([len(a) > 1 or (len(a) == 1 and (a[0][1] != 'PUNCT' or a[0][3] is None)) for a in answers],
+                    dtype=bool)
+
+
+def invalid_pairs(questions, answers):
+    # Verdict codes (indices into VERDICTS) of the pairs of a Shard of questions and a list of answers
+    # (column rows): 1 if the question is certainly invalid, 2 if the answer is, 0 otherwise.
+    # An answer is valid as in answer_valid: something is left after dropping a final punctuation token.
+    return _verdicts(question_features(questions), _answers_valid(answers))
+
+
+def corpus_features(corpus):
+    # question_features of the questions of a binary corpus (corpus.Corpus) and answer_valid of its
+    # answers, straight from its columns
+    shard = corpus.shard()
+    n = len(corpus) // 2
+    q_features = dict((name, f[0:2 * n:2]) for name, f in question_features(shard).items())
+    return q_features, answer_valid(shard)[1:2 * n:2]
+
+
+def corpus_invalid_pairs(corpus):
+    # invalid_pairs of every pair of a binary corpus
+    return _verdicts(*corpus_features(corpus))
+
+
+def prefilter(pairs, block_size=4096):
+    # Turns (question, answer) pairs of column rows (see reader.parse_columns) into (question, answer,
+    # features) triples of Tokens and feature_rows for qa2d, but replaces the pairs that are certainly
+    # invalid by their QA2DResult, so that no Token, Question or AnswerSpan is built for them
+    # (qa2d_batch passes results through).
+    pairs = iter(pairs)
+    while True:
+        block = list(islice(pairs, block_size))
+        if len(block) == 0:
+            return
+        q_features = question_features(load_shard([q for q, _ in block]))
+        codes = _verdicts(q_features, _answers_valid([a for _, a in block]))
+        for i, ((question, answer), code, features) in enumerate(zip(block, codes.tolist(),
+                                                                     feature_rows(q_features))):
+            if code:
+                _count_verdict(code, q_features, i)
+                yield VERDICTS[code]
+            else:
+                yield [Token(*row) for row in question], [Token(*row) for row in answer], features
+
+
+def corpus_prefilter(corpus, pairs, block_size=256):
+    # Like prefilter, for (pair index, pair) of a binary corpus. The features of the whole corpus come
+    # from its columns at once, and the sentence views of the pairs stay lazy. The feature_rows are made
+    # for block_size pairs at a time, starting at the first pair that needs them.
+    q_features, a_valid = corpus_features(corpus)
+    codes = _verdicts(q_features, a_valid).tolist()
+    first, rows = 0, []
+    for idx, (question, answer) in pairs:
+        code = codes[idx]
+        if code:
+            _count_verdict(code, q_features, idx)
+            yield VERDICTS[code]
+            continue
+        if not first <= idx < first + len(rows):
+            first, rows = idx, feature_rows(q_features, idx, idx + block_size)
+        yield question, answer, rows[idx - first]
@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+from reader import parse
+
+# Sidecar index of a CoNLL-U file with alternating questions and answers: the byte offset at which
+# every pair starts, plus the offset where the last pair ends. Layout: MAGIC, then the size and
+# modification time (ns) of the CoNLL-U file it was built from and the number of pairs (3 x int64,
+# little-endian), then the offsets (int64, native byte order). An index whose size or modification
+# time does not match its file is stale and rebuilt.
+MAGIC = b'QA2DIDX1'
+HEADER = struct.Struct('<qqq')
+
+
+def index_path(path):
+    return path + '.idx'
+
+
+def scan(f):
+    # Offsets of the pairs in the binary file f (see above). Sentences are blocks of non-blank lines,
+    # as for reader.iter_sentences; a final question without an answer is not part of any pair.
+    offsets = array('q')
+    pos = 0
+    sentences = 0
+    in_sentence = False
+    for line in f:
+        if line.strip():
+            if not in_sentence:
+                if sentences % 2 == 0:
+                    offsets.append(pos)
+                sentences += 1
+                in_sentence = True
+        else:
+            in_sentence = False
+        pos += len(line)
+    if sentences % 2 == 1:
+        pos = offsets.pop()
+    offsets.append(pos)
+    return offsets
+
+
+def build_index(path, must_save=True):
+    # Writes the index of the CoNLL-U file path next to it and returns the offsets. If the index cannot
+    # be written (e.g. in a read-only directory), raises OSError, or with must_save=False only returns
+    # the offsets.
+    st = os.stat(path)
+    with open(path, 'rb') as f:
+        offsets = scan(f)
+    tmp = index_path(path) + '.tmp'
+    try:
+        with open(tmp, 'wb') as f:
+            f.write(MAGIC)
+            f.write(HEADER.pack(st.st_size, st.st_mtime_ns, len(offsets) - 1))
+            offsets.tofile(f)
+        os.replace(tmp, index_path(path))
+    except OSError:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        if must_save:
+            raise
+    return offsets
+
+
+def load_index(path):
+    # The offsets of the CoNLL-U file path from its index, or None if there is none, it is stale or it
+    # is truncated
+    idx = index_path(path)
+    if not os.path.exists(idx):
+        return None
+    st = os.stat(path)
+    with open(idx, 'rb') as f:
+        length = os.fstat(f.fileno()).st_size
+        if length < len(MAGIC) + HEADER.size or f.read(len(MAGIC)) != MAGIC:
+            return None
+        size, mtime_ns, n = HEADER.unpack(f.read(HEADER.size))
+        if size != st.st_size or mtime_ns != st.st_mtime_ns:
+            return None
+        if n < 0 or length != len(MAGIC) + HEADER.size + (n + 1) * array('q').itemsize:
+            return None
+        offsets = array('q')
+        offsets.fromfile(f, n + 1)
+    return offsets
+
+
+class PairIndex(object):
+    # Random access to the pairs of a CoNLL-U file: pair n is read from a memory mapping of the file
+    # and parsed on its own. The index is built (and saved) if it is missing, stale or truncated; where
+    # it cannot be saved, it is only kept in memory.
+    def __init__(self, path):
+        self.path = path
+        self.offsets = load_index(path)
+        if self.offsets is None:
+            self.offsets = build_index(path, must_save=False)
+        self._mmap = None
+        if self.offsets[-1] > 0:
+            with open(path, 'rb') as f:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def _check(self, n):
+        if not 0 <= n < len(self):
+            raise IndexError('pair {} is out of range ({} pairs in {})'.format(n, len(self), self.path))
+
+    def text(self, n):
+        # The CoNLL-U text of pair n
+        self._check(n)
+        return self._mmap[self.offsets[n]:self.offsets[n + 1]].decode('utf-8')
+
+    def end(self, n):
+        # Byte offset just after pair n
+        self._check(n)
+        return self.offsets[n + 1]
+
+    def __getitem__(self, n):
+        # Pair n as (question, answer) lists of Tokens, like qa2d.read_pairs
+        question, answer = parse(self.text(n))[:2]
+        return question, answer
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+
+def parse_ids(spec):
+    # Pair ids from a spec such as '3,17,100:200' (stop excluded), or from a file with '@failing.txt'
+    # (ids separated by whitespace or commas)
+    if spec.startswith('@'):
+        with open(spec[1:], 'r') as f:
+            spec = ','.join(f.read().split())
+    ids = []
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if ':' in part:
+            start, stop = part.split(':')
+            ids.extend(range(int(start), int(stop)))
+        else:
+            ids.append(int(part))
+    return ids
+
+
+def main(argv=None):
+    import argparse
+    from rule import qa2d
+
+    parser = argparse.ArgumentParser(description='Build the pair index of a CoNLL-U file, or show single pairs.')
+    parser.add_argument('input', help='CoNLL-U file with alternating questions and answers')
+    parser.add_argument('ids', nargs='?', help='pairs to show with their conversion, e.g. 3,17,100:110 or @ids.txt')
+    args = parser.parse_args(argv)
+    if args.ids is None:
+        offsets = build_index(args.input)
+        sys.stderr.write('Indexed {} pairs in {}\n'.format(len(offsets) - 1, index_path(args.input)))
+        return 0
+    index = PairIndex(args.input)
+    for n in parse_ids(args.ids):
+        question, answer = index[n]
+        result = qa2d(question, answer)
+        sys.stdout.write('# pair {}: {} {} {}\n'.format(n, result.status, result.type or '',
+                                                       ' '.join(result.declr or [])))
+        sys.stdout.write(index.text(n))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
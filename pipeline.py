@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+import rule
+import verbs
+
+# Staged conversion: a reader thread (reading and parsing the input), a compute stage (a pool of
+# worker processes, or a thread with workers=1) and a writer thread, connected by bounded queues of
+# chunks. A full queue blocks the stage before it, so a slow writer or a slow pool holds back the
+# reader instead of letting chunks pile up in memory.
+
+
+def _timed_chunk(chunk, profile=False):
+    # Runs in a worker process: _qa2d_chunk plus the time it took
+    start = time.perf_counter()
+    results, report = rule._qa2d_chunk(chunk, profile)
+    return results, report, time.perf_counter() - start
+
+
+class _Stopped(Exception):
+    pass
+
+
+class Pipeline(object):
+    def __init__(self, workers=1, chunksize=64, queue_size=None, sample_every=0.05):
+        if workers is None:
+            workers = os.cpu_count() or 1
+        self.workers = workers
+        self.chunksize = chunksize
+        self.queue_size = queue_size or 2 * max(workers, 1)
+        self.sample_every = sample_every
+        self.stats = None
+        self._stop = threading.Event()
+        self._error = None
+
+    def _put(self, q, item):
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+        raise _Stopped()
+
+    def _get(self, q):
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        raise _Stopped()
+
+    def _stage(self, name, func, *args):
+        stage = self.stats['stages'][name]
+        start = time.perf_counter()
+        try:
+            func(stage, *args)
+        except _Stopped:
+            pass
+        except BaseException as e:
+            if self._error is None:
+                self._error = e
+            self._stop.set()
+        finally:
+            stage['wall_s'] = time.perf_counter() - start
+
+    def _read(self, stage, source, chunks):
+        # source yields (key, item); a chunk is (keys, items)
+        keys, items = [], []
+        source = iter(source)
+        while True:
+            start = time.perf_counter()
+            for key, item in source:
+                keys.append(key)
+                items.append(item)
+                if len(items) == self.chunksize:
+                    break
+            stage['busy_s'] += time.perf_counter() - start
+            if len(items) == 0:
+                break
+            stage['items'] += len(items)
+            start = time.perf_counter()
+            self._put(chunks, (keys, items))
+            stage['blocked_s'] += time.perf_counter() - start
+            keys, items = [], []
+        self._put(chunks, None)
+
+    def _compute(self, stage, chunks, done, pool):
+        profile = rule._profile is not None
+        while True:
+            start = time.perf_counter()
+            chunk = self._get(chunks)
+            stage['blocked_s'] += time.perf_counter() - start
+            if chunk is None:
+                break
+            keys, items = chunk
+            if pool is None:
+                start = time.perf_counter()
+                results = [item if isinstance(item, rule.QA2DResult) else rule.qa2d(*item) for item in items]
+                stage['busy_s'] += time.perf_counter() - start
+                stage['items'] += len(items)
+                result = (results, None, 0.0)
+            else:
+                result = pool.submit(_timed_chunk, items, profile)
+            start = time.perf_counter()
+            self._put(done, (keys, result))
+            stage['blocked_s'] += time.perf_counter() - start
+        self._put(done, None)
+
+    def _write(self, stage, done, sink):
+        compute = self.stats['stages']['compute']
+
+        def results():
+            while True:
+                start = time.perf_counter()
+                chunk = self._get(done)
+                if chunk is None:
+                    stage['blocked_s'] += time.perf_counter() - start
+                    return
+                keys, result = chunk
+                if not isinstance(result, tuple):
+                    result = result.result()
+                    compute['busy_s'] += result[2]
+                    compute['items'] += len(keys)
+                    rule.merge_profile(result[1])
+                stage['blocked_s'] += time.perf_counter() - start
+                for key, r in zip(keys, result[0]):
+                    stage['items'] += 1
+                    yield key, r
+
+        start = time.perf_counter()
+        sink(results())
+        stage['busy_s'] = time.perf_counter() - start - stage['blocked_s']
+
+    def run(self, source, sink):
+        # Converts the items of source, (key, (question, answer) or QA2DResult), and calls sink once
+        # with an iterator over (key, QA2DResult) in input order. Returns the statistics of the run.
+        stages = OrderedDict((name, {'items': 0, 'busy_s': 0.0, 'blocked_s': 0.0, 'wall_s': 0.0})
+                             for name in ('read', 'compute', 'write'))
+        queues = OrderedDict((name, {'capacity': self.queue_size, 'samples': 0, 'depth_sum': 0, 'max_depth': 0})
+                             for name in ('read->compute', 'compute->write'))
+        self.stats = {'stages': stages, 'queues': queues}
+        self._stop.clear()
+        self._error = None
+        chunks = queue.Queue(self.queue_size)
+        done = queue.Queue(self.queue_size)
+
+        pool = None
+        if self.workers > 1:
+            from concurrent.futures import ProcessPoolExecutor
+            # Before the workers start, which do not warn (see verbs.has_pattern)
+            verbs.has_pattern()
+            pool = ProcessPoolExecutor(max_workers=self.workers)
+        threads = [threading.Thread(target=self._stage, args=('read', self._read, source, chunks)),
+                   threading.Thread(target=self._stage, args=('compute', self._compute, chunks, done, pool)),
+                   threading.Thread(target=self._stage, args=('write', self._write, done, sink))]
+        start = time.perf_counter()
+        try:
+            for t in threads:
+                t.daemon = True
+                t.start()
+            while any(t.is_alive() for t in threads):
+                threads[-1].join(self.sample_every)
+                if not threads[-1].is_alive():
+                    # Nothing is read from the queues anymore (the writer finished or failed)
+                    self._stop.set()
+                for name, q in zip(queues, (chunks, done)):
+                    depth = q.qsize()
+                    queues[name]['samples'] += 1
+                    queues[name]['depth_sum'] += depth
+                    queues[name]['max_depth'] = max(queues[name]['max_depth'], depth)
+        finally:
+            self._stop.set()
+            for t in threads:
+                t.join()
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+        if self._error is not None:
+            raise self._error
+        return self.report(time.perf_counter() - start)
+
+    def report(self, wall_s):
+        stages = OrderedDict()
+        for name, s in self.stats['stages'].items():
+            stages[name] = OrderedDict([('items', s['items']),
+                                        ('items_per_s', round(s['items'] / max(wall_s, 1e-9), 1)),
+                                        ('busy_s', round(s['busy_s'], 3)), ('blocked_s', round(s['blocked_s'], 3))])
+        queues = OrderedDict()
+        for name, q in self.stats['queues'].items():
+            queues[name] = OrderedDict([('capacity', q['capacity']),
+                                        ('mean_depth', round(q['depth_sum'] / max(q['samples'], 1), 2)),
+                                        ('max_depth', q['max_depth'])])
+        return OrderedDict([('wall_s', round(wall_s, 3)), ('workers', self.workers), ('stages', stages),
+                            ('queues', queues)])
+
+
+def format_report(report):
+    # The report as a few lines of text
+    lines = ['pipeline: {:.2f}s, {} worker(s)'.format(report['wall_s'], report['workers'])]
+    for name, s in report['stages'].items():
+        lines.append('  {:<8} {:>8} items {:>10.1f}/s  busy {:.2f}s  blocked {:.2f}s'.format(
+            name, s['items'], s['items_per_s'], s['busy_s'], s['blocked_s']))
+    for name, q in report['queues'].items():
+        lines.append('  {:<15} depth {:.1f} mean, {} max of {}'.format(
+            name, q['mean_depth'], q['max_depth'], q['capacity']))
+    return '\n'.join(lines)
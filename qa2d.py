@@ -0,0 +1,434 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+import argparse
+import io
+import json
+import os
+import sys
+from collections import deque
+
+import rule
+import verbs
+from corpus import Corpus, is_binary_corpus
+from detok import detokenize
+from reader import iter_sentences, parse, parse_columns, parse_line
+from rule import qa2d_batch, OK
+from writer import JsonlWriter, record
+
+
+def read_pairs(f):
+    # Questions and answers alternate in the file: question 1, answer 1, question 2, ...
+    # The sentences are lists of Tokens (see reader.py).
+    question = None
+    for sentence in iter_sentences(f):
+        if question is None:
+            question = sentence
+        else:
+            yield question, sentence
+            question = None
+
+
+def read_pairs_at(f, offset=0, parse_word=parse_line, keep=None):
+    # Like read_pairs, but reads the binary file f from byte offset and yields
+    # (offset just after the pair, (question, answer)), so a run can be resumed from any pair.
+    # Word lines are parsed with parse_word (reader.parse_line or reader.parse_columns). With keep,
+    # only the n-th pair read for which keep(n) is true is parsed; the others are yielded as None.
+    if offset:
+        f.seek(offset)
+    pos = offset
+    n = 0
+    parse = keep is None or keep(0)
+    sentence = None
+    sentences = []
+    for line in f:
+        pos += len(line)
+        if not line.isspace():
+            if sentence is None:
+                sentence = []
+            if parse:
+                tok = parse_word(line.decode('utf-8'))
+                if tok is not None:
+                    sentence.append(tok)
+            continue
+        if sentence is not None:
+            sentences.append(sentence)
+            sentence = None
+        if len(sentences) == 2:
+            yield pos, tuple(sentences) if parse else None
+            sentences = []
+            n += 1
+            parse = keep is None or keep(n)
+    if sentence is not None:
+        sentences.append(sentence)
+    if len(sentences) == 2:
+        yield pos, tuple(sentences) if parse else None
+
+
+def iter_input(path, offset=0, index=0, parse_word=parse_line, keep=None):
+    # Yields (input offset after the pair, pair index, pair). For CoNLL-U files the offset is a byte
+    # offset and the word lines are parsed with parse_word, for binary corpora it is the pair index.
+    # With keep, pairs whose index fails keep(index) are None: their lines are not parsed (the views
+    # of a binary corpus are lazy anyway).
+    def keep_shifted(n):
+        return keep(index + n)
+
+    keep_read = None if keep is None else keep_shifted
+    if path == '-':
+        for idx, (_, pair) in enumerate(read_pairs_at(sys.stdin.buffer, 0, parse_word, keep_read)):
+            yield None, idx, pair
+    elif is_binary_corpus(path):
+        for idx, pair in enumerate(Corpus.open(path).pairs(start=offset), index):
+            yield idx + 1, idx, pair
+    else:
+        with open(path, 'rb') as f:
+            for idx, (end, pair) in enumerate(read_pairs_at(f, offset, parse_word, keep_read), index):
+                yield end, idx, pair
+
+
+def iter_ids(path, ids, parse_word=parse_line):
+    # Like iter_input, but yields only the pairs with the given indices, in that order, reading each
+    # one directly (from the memory-mapped binary corpus, or through the pair index of a CoNLL-U file)
+    if is_binary_corpus(path):
+        corpus = Corpus.open(path)
+        for idx in ids:
+            yield None, idx, (corpus[2 * idx], corpus[2 * idx + 1])
+    else:
+        from offsets import PairIndex
+        index = PairIndex(path)
+        for idx in ids:
+            yield index.end(idx), idx, tuple(parse(index.text(idx), parse_word)[:2])
+
+
+def count_pairs(path):
+    if is_binary_corpus(path):
+        return len(Corpus.open(path)) // 2
+    from offsets import PairIndex
+    return len(PairIndex(path))
+
+
+class Checkpoint(object):
+    # Progress of a run: the input offset and index of the next pair, the size of the output written
+    # for the pairs before it, and the status counters. Saved atomically after the output is synced.
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, 'r') as f:
+            return json.load(f)
+
+    def save(self, state):
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(state, f, sort_keys=True)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+
+# Lines about skipped pairs written to the log at once
+LOG_BLOCK = 1024
+
+
+def write_results(results, out, state, log=sys.stderr, on_progress=None, tokenized=False):
+    # One output line per input pair (of this shard), so line N always belongs to the N-th pair.
+    # results yields (input offset after the pair, pair index, QA2DResult).
+    # The lines about skipped pairs are written to log LOG_BLOCK at a time.
+    counts = state['counts']
+    skipped = []
+    try:
+        for end, idx, result in results:
+            counts[result.status] = counts.get(result.status, 0) + 1
+            if result.status == OK:
+                line = ' '.join(result.declr) if tokenized else detokenize(result.declr)
+                out.write(line.encode('utf-8'))
+            else:
+                skipped.append('Example {} skipped: {}.\n'.format(idx, result.status))
+                if len(skipped) >= LOG_BLOCK:
+                    log.write(''.join(skipped))
+                    del skipped[:]
+            out.write(b'\n')
+            state['input_offset'] = end
+            state['next_index'] = idx + 1
+            state['written'] += 1
+            if on_progress is not None:
+                on_progress()
+    finally:
+        if len(skipped) > 0:
+            log.write(''.join(skipped))
+    return counts
+
+
+def write_records(results, writer, state, on_progress=None, tokenized=False):
+    # Like write_results, but writes a JSON record with the metadata of every pair (see writer.record)
+    counts = state['counts']
+    for end, idx, result in results:
+        counts[result.status] = counts.get(result.status, 0) + 1
+        writer.write(record(idx, result, tokenized))
+        state['input_offset'] = end
+        state['next_index'] = idx + 1
+        state['written'] += 1
+        if on_progress is not None:
+            on_progress()
+    return counts
+
+
+def iter_shard(path, state, shard=(0, 1), prefilter=False, ids=None, stop=None):
+    # Yields ((input offset after the pair, pair index), pair) for the pairs of the shard starting at
+    # the position recorded in state and ending before pair index stop, or for the pairs in ids;
+    # with prefilter, pairs that are certainly invalid are QA2DResults and the others carry the
+    # features of their question (see features.prefilter)
+    k, n = shard
+    positions = deque()
+    binary = path != '-' and is_binary_corpus(path)
+    # For the prefilter, CoNLL-U pairs are read as column rows; it builds Tokens only for the pairs it keeps
+    parse_word = parse_columns if prefilter and not binary else parse_line
+    if ids is None:
+        # Only the pairs of this shard are parsed
+        source = iter_input(path, state['input_offset'], state['next_index'], parse_word,
+                            None if n == 1 else lambda idx: idx % n == k)
+    else:
+        source = iter_ids(path, ids, parse_word)
+
+    def pairs():
+        for end, idx, pair in source:
+            if stop is not None and idx >= stop:
+                break
+            if idx % n == k:
+                positions.append((end, idx))
+                yield pair
+
+    items = pairs()
+    if prefilter and binary:
+        from features import corpus_prefilter
+        items = corpus_prefilter(Corpus.open(path), ((positions[-1][1], pair) for pair in items))
+    elif prefilter:
+        from features import prefilter as bulk_prefilter
+        items = bulk_prefilter(items)
+    for item in items:
+        yield positions.popleft(), item
+
+
+def convert(path, state, shard=(0, 1), workers=1, chunksize=64, prefilter=False, cache=None, ids=None, stop=None):
+    # Converts the pairs of the shard starting at the position recorded in state and ending before
+    # pair index stop (or the pairs in ids), yielding (input offset after the pair, pair index,
+    # QA2DResult) in input order. Pairs found in cache (a cache.ResultCache) are not converted again.
+    positions = deque()
+    source = iter_shard(path, state, shard, prefilter, ids, stop)
+    if cache is not None:
+        source = cache.lookup(source)
+
+    def items():
+        for position, item in source:
+            positions.append(position)
+            yield item
+
+    results = ((positions.popleft(), result)
+               for result in qa2d_batch(items(), workers=workers, chunksize=chunksize))
+    if cache is not None:
+        results = cache.store(results)
+    for (end, idx), result in results:
+        yield end, idx, result
+
+
+def convert_pipelined(path, state, write, shard=(0, 1), workers=1, chunksize=64, prefilter=False,
+                      queue_size=None, cache=None, ids=None):
+    # Like convert, but reads, converts and writes in overlapping stages (see pipeline.py);
+    # write is called with the results of convert. Returns the statistics of the pipeline.
+    from pipeline import Pipeline
+
+    source = iter_shard(path, state, shard, prefilter, ids)
+    if cache is not None:
+        source = cache.lookup(source)
+
+    def sink(results):
+        if cache is not None:
+            results = cache.store(results)
+        write((end, idx, result) for (end, idx), result in results)
+
+    return Pipeline(workers, chunksize, queue_size).run(source, sink)
+
+
+def open_input(path):
+    if path == '-':
+        return io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8')
+    return open(path, 'r', encoding='utf-8')
+
+
+def open_output(path, offset=None):
+    # Binary output; with offset, an existing file is truncated there and appended to
+    if path == '-':
+        return sys.stdout.buffer
+    if offset is None:
+        return open(path, 'wb')
+    out = open(path, 'r+b' if os.path.exists(path) else 'wb')
+    out.seek(offset)
+    out.truncate()
+    return out
+
+
+def _parse_shard(s):
+    k, n = [int(x) for x in s.split('/')]
+    if not 0 <= k < n:
+        raise argparse.ArgumentTypeError('shard must be K/N with 0 <= K < N')
+    return k, n
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Transform dependency parsed question/answer pairs '
+                                                 'into declarative sentences.')
+    parser.add_argument('input', nargs='?', default='-',
+                        help='CoNLL-U file with alternating questions and answers, or a binary corpus '
+                             'written by corpus.py (default: stdin)')
+    parser.add_argument('-o', '--output', default='-', help='output file, one sentence per pair (default: stdout)')
+    parser.add_argument('-j', '--workers', type=int, default=1,
+                        help='number of worker processes (default: 1, 0 for one per CPU)')
+    parser.add_argument('--chunksize', type=int, default=64, help='pairs sent to a worker at a time (default: 64)')
+    parser.add_argument('--profile', metavar='REPORT',
+                        help='time the rule stages, count answer types and skip reasons, and write them to REPORT (JSON)')
+    parser.add_argument('--prefilter', action='store_true',
+                        help='drop invalid pairs in bulk with NumPy, from the raw columns, before building their Tokens '
+                             '(needs numpy)')
+    parser.add_argument('--shard', type=_parse_shard, default=(0, 1), metavar='K/N',
+                        help='only convert pairs whose index is K modulo N (default: 0/1)')
+    parser.add_argument('--checkpoint', metavar='PATH',
+                        help='record progress in PATH and resume from it if it exists (needs a file input and output)')
+    parser.add_argument('--checkpoint-every', type=int, default=10000, metavar='N',
+                        help='pairs between checkpoints (default: %(default)s)')
+    parser.add_argument('--tokenized', action='store_true',
+                        help='write the tokens separated by spaces instead of detokenized sentences')
+    parser.add_argument('--format', choices=['text', 'jsonl'], default='text',
+                        help='one sentence per line, or one JSON record per pair with its id, sentence, type, '
+                             'answer position and skip reason (default: %(default)s)')
+    parser.add_argument('--compress', choices=['gzip', 'lzma'],
+                        help='compress the JSONL output (default: from the suffix of the output, .gz or .xz)')
+    parser.add_argument('--max-bytes', type=int, metavar='N',
+                        help='split the JSONL output into files of about N uncompressed bytes, '
+                             'named OUTPUT-00000.jsonl and so on')
+    parser.add_argument('--pipeline', action='store_true',
+                        help='read, convert and write in overlapping stages connected by bounded queues, '
+                             'and report the throughput of every stage')
+    parser.add_argument('--queue-size', type=int, metavar='N',
+                        help='chunks each pipeline queue holds (default: 2 per worker)')
+    parser.add_argument('--cache', metavar='PATH',
+                        help='reuse the results of pairs seen before, stored in the SQLite file PATH '
+                             '(emptied when the rules change)')
+    parser.add_argument('--cache-size', type=int, default=100000, metavar='N',
+                        help='results kept in memory in front of the cache file (default: %(default)s)')
+    parser.add_argument('--ids', metavar='IDS',
+                        help='only convert these pairs, e.g. 3,17,100:200 or @failing.txt, reading them directly '
+                             '(CoNLL-U input gets a pair index, INPUT.idx)')
+    args = parser.parse_args(argv)
+    if args.format == 'text' and (args.compress or args.max_bytes):
+        parser.error('--compress and --max-bytes need --format jsonl')
+
+    if args.profile:
+        rule.enable_profiling()
+    # Warns here, once, if verbs fall back to the regular rules, rather than in every worker
+    verbs.has_pattern()
+
+    state = {'input': os.path.abspath(args.input), 'shard': list(args.shard), 'input_offset': 0, 'next_index': 0,
+             'output_offset': 0, 'written': 0, 'counts': {}, 'done': False}
+    checkpoint = None
+    if args.checkpoint:
+        if args.input == '-' or args.output == '-':
+            parser.error('--checkpoint needs an input and an output file')
+        # A run is resumed only with the same output options and an unchanged input, whose offsets the
+        # checkpoint holds
+        st = os.stat(args.input)
+        state.update(input_size=st.st_size, input_mtime_ns=st.st_mtime_ns,
+                     options={'format': args.format, 'tokenized': args.tokenized, 'prefilter': args.prefilter})
+        checkpoint = Checkpoint(args.checkpoint)
+        saved = checkpoint.load()
+        if saved is not None:
+            if saved['input'] != state['input'] or saved['shard'] != state['shard']:
+                parser.error('checkpoint {} belongs to another input or shard'.format(args.checkpoint))
+            if saved.get('options') != state['options']:
+                parser.error('checkpoint {} was written with other options: {}'.format(args.checkpoint,
+                                                                                      saved.get('options')))
+            if saved.get('input_size') != state['input_size'] or saved.get('input_mtime_ns') != state['input_mtime_ns']:
+                parser.error('{} changed since checkpoint {} was written'.format(args.input, args.checkpoint))
+            if not os.path.exists(args.output) or os.path.getsize(args.output) < saved['output_offset']:
+                parser.error('{} is missing or shorter than checkpoint {} records ({} bytes)'.format(
+                    args.output, args.checkpoint, saved['output_offset']))
+            state = saved
+            sys.stderr.write('Resuming after {} pairs.\n'.format(state['written']))
+
+    ids = None
+    if args.ids:
+        if args.input == '-' or checkpoint:
+            parser.error('--ids needs an input file and cannot be used with --checkpoint')
+        from offsets import parse_ids
+        ids = parse_ids(args.ids)
+        n = count_pairs(args.input)
+        bad = [idx for idx in ids if not 0 <= idx < n]
+        if len(bad) > 0:
+            parser.error('pair {} is out of range ({} pairs)'.format(bad[0], n))
+
+    offset = state['output_offset'] if checkpoint else None
+    if args.format == 'jsonl':
+        try:
+            out = JsonlWriter(args.output, args.compress, args.max_bytes, offset=offset)
+        except ValueError as e:
+            parser.error(str(e))
+    else:
+        out = open_output(args.output, offset)
+
+    def save():
+        out.flush()
+        os.fsync(out.fileno())
+        state['output_offset'] = out.tell()
+        checkpoint.save(state)
+
+    def on_progress():
+        if state['written'] % args.checkpoint_every == 0:
+            save()
+
+    def write(results):
+        write_output = write_records if args.format == 'jsonl' else write_results
+        write_output(results, out, state, on_progress=on_progress if checkpoint else None, tokenized=args.tokenized)
+
+    pipeline_report = None
+    cache = None
+    if args.cache:
+        from cache import ResultCache
+        cache = ResultCache(args.cache, args.cache_size)
+    try:
+        if not state['done']:
+            if args.pipeline:
+                pipeline_report = convert_pipelined(args.input, state, write, args.shard, args.workers or None,
+                                                    args.chunksize, args.prefilter, args.queue_size, cache, ids)
+            else:
+                write(convert(args.input, state, args.shard, args.workers or None, args.chunksize, args.prefilter,
+                              cache, ids))
+            state['done'] = True
+            if checkpoint:
+                save()
+    finally:
+        if cache is not None:
+            cache.close()
+        if isinstance(out, JsonlWriter):
+            out.close()
+        else:
+            out.flush()
+            if out is not sys.stdout.buffer:
+                out.close()
+    if cache is not None:
+        sys.stderr.write('Cache: {memory_hits} memory hits, {disk_hits} disk hits, {misses} misses\n'.format(
+            **cache.report()))
+    if pipeline_report is not None:
+        from pipeline import format_report
+        sys.stderr.write(format_report(pipeline_report) + '\n')
+    if args.profile:
+        report = rule.profile_report()
+        if pipeline_report is not None:
+            report['pipeline'] = pipeline_report
+        with open(args.profile, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    sys.stderr.write('Done: {}\n'.format(', '.join('{} {}'.format(v, k) for k, v in sorted(state['counts'].items()))))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+from rule import Token
+
+# CoNLL-U reader that keeps only the columns rule.py reads (form, upostag, xpostag, head, deprel) and
+# builds Tokens directly. Values are as conllu.parse gives them: head is an int (None for '_') and an
+# empty xpostag ('_') is None. Comment lines, multiword token lines (1-2) and empty nodes (1.1) are
+# skipped, so the tokens of a sentence are its words in order.
+
+
+def parse_columns(line):
+    # The (form, upostag, xpostag, head, deprel) columns of a word line, in the order Token takes them,
+    # or None for a comment, multiword token or empty node line.
+    # Blank lines (sentence boundaries) are handled by the callers.
+    if line[0] == '#':
+        return None
+    cols = line.split('\t', 8)
+    if len(cols) < 9:
+        raise ValueError('expected 10 tab-separated columns: {!r}'.format(line))
+    idx = cols[0]
+    if '-' in idx or '.' in idx:
+        return None
+    head = cols[6]
+    xpostag = cols[4]
+    return (cols[1], cols[3], None if xpostag == '_' else xpostag,
+            None if head == '_' else int(head), cols[7])
+
+
+def parse_line(line):
+    # The Token of a word line, or None (see parse_columns)
+    cols = parse_columns(line)
+    return None if cols is None else Token(*cols)
+
+
+def iter_sentences(lines, parse_word=parse_line):
+    # Yields every sentence of an iterable of CoNLL-U lines as a list of Tokens
+    # (or of whatever parse_word makes of a word line, e.g. parse_columns)
+    sentence = None
+    for line in lines:
+        if not line or line.isspace():
+            if sentence is not None:
+                yield sentence
+                sentence = None
+            continue
+        if sentence is None:
+            sentence = []
+        tok = parse_word(line)
+        if tok is not None:
+            sentence.append(tok)
+    if sentence is not None:
+        yield sentence
+
+
+def parse(text, parse_word=parse_line):
+    return list(iter_sentences(text.split('\n'), parse_word))
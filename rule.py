@@ -1,57 +1,435 @@
 #!/usr/bin/env python
 # -*- coding: UTF-8 -*-
-import string
-import pattern
-from copy import deepcopy
+import os
+import sys
+import time
+from collections import deque, namedtuple
+from itertools import islice
 
-alpha = string.ascii_uppercase
-alpha_lower = string.ascii_lowercase
+import detok
+from verbs import conjugate, has_pattern, PAST, PRES_3SG
 
-translator = str.maketrans('', '', string.punctuation)
+# Same as string.ascii_uppercase, string.ascii_lowercase and string.punctuation;
+# importing string pulls in re, which dominates the import time of this module
+alpha = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+alpha_lower = 'abcdefghijklmnopqrstuvwxyz'
+punctuation = r"""!"#$%&'()*+,-./:;<=>?@[\]^_`{|}~"""
 
+translator = str.maketrans('', '', punctuation)
+
+# Word classes are frozensets of interned strings, so membership tests are a single hash lookup
 PREP_DICT = {'where': 'in', 'when': 'in', 'how': 'by', 'why': 'because'}
-AUX_DO = ['do', 'does', 'did']
-VERB_DO = ['do', 'does', 'did', 'done', 'doing']
-SUBJ_WH = ['what', 'who', 'which', 'whom', 'whose']
-AUX_BE = ['is', 'are', 'was', 'were', 'been', 'being', 'be']
-AUX_HAVE = ['has', 'have', 'had']
-PREPS = ['TO', 'IN', 'RP']
-AUX = AUX_BE + AUX_DO + AUX_HAVE
-TIME_WORDS = ['year', 'month', 'day', 'hour', 'decade', 'century', 'millenium']
-DETS = ['the', 'a', 'an']
-
-with open('preps.txt', 'r') as f:
-    common_preps = f.read().splitlines()
+AUX_DO = frozenset(['do', 'does', 'did'])
+VERB_DO = frozenset(['do', 'does', 'did', 'done', 'doing'])
+SUBJ_WH = frozenset(['what', 'who', 'which', 'whom', 'whose'])
+AUX_BE = frozenset(['is', 'are', 'was', 'were', 'been', 'being', 'be'])
+AUX_HAVE = frozenset(['has', 'have', 'had'])
+PREPS = frozenset(['TO', 'IN', 'RP'])
+AUX = AUX_BE | AUX_DO | AUX_HAVE
+TIME_WORDS = frozenset(['year', 'month', 'day', 'hour', 'decade', 'century', 'millenium'])
+DETS = frozenset(['the', 'a', 'an'])
+VERB_UPOS = frozenset(['VERB', 'AUX'])
+
+# Per-example outcomes of qa2d
+OK = 'ok'
+INVALID_QUESTION = 'invalid_question'
+INVALID_ANSWER = 'invalid_answer'
+ERROR = 'error'
+QA2DResult = namedtuple('QA2DResult', ['status', 'declr', 'type', 'answer_pos'])
+QA2DResult.__new__.__defaults__ = (None, None, None)
+# One entry of Question.nbest
+Candidate = namedtuple('Candidate', ['answer_pos', 'answer', 'declr'])
+# The lazy features of Question that can be given to it, computed beforehand (see features.feature_rows)
+QUESTION_FEATURES = ('lastword_idx', 'wh_is_quantity', 'wh_is_time', 'wh_is_happened')
+_question_feature_set = frozenset(QUESTION_FEATURES)
+
+PREPS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'preps.txt')
+
+# Resources are loaded on first use, so importing this module stays cheap
+_common_preps = None
+
+
+def get_common_preps():
+    global _common_preps
+    if _common_preps is None:
+        with open(PREPS_PATH, 'r') as f:
+            _common_preps = frozenset(sys.intern(p) for p in f.read().splitlines())
+    return _common_preps
+
+
+def __getattr__(name):
+    # Keeps rule.common_preps working without reading preps.txt at import time
+    if name == 'common_preps':
+        return get_common_preps()
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+
+def _intern(s):
+    return None if s is None else sys.intern(s)
+
+
+class Token(object):
+    # Compact token holding only the CoNLL-U columns the rules read.
+    # Strings are interned, so the same form or tag is stored once per process.
+    __slots__ = ('id', '_form', 'lower', 'upostag', 'xpostag', 'head', 'deprel')
+
+    def __init__(self, form, upostag=None, xpostag=None, head=None, deprel=None, id=None):
+        self.id = id
+        self.form = form
+        self.upostag = _intern(upostag)
+        self.xpostag = _intern(xpostag)
+        self.head = head
+        self.deprel = _intern(deprel)
+
+    @classmethod
+    def from_dict(cls, tok):
+        # From a conllu token (or any dict with the same keys)
+        return cls(tok['form'], tok['upostag'], tok['xpostag'], tok['head'], tok['deprel'])
+
+    @property
+    def form(self):
+        return self._form
+
+    @form.setter
+    def form(self, form):
+        self._form = sys.intern(form)
+        self.lower = sys.intern(form.lower())
+
+    def copy(self):
+        return Token(self.form, self.upostag, self.xpostag, self.head, self.deprel, self.id)
+
+    def __repr__(self):
+        return 'Token({!r}, {!r}, {!r}, {!r}, {!r}, id={!r})'.format(
+            self.form, self.upostag, self.xpostag, self.head, self.deprel, self.id)
+
+
+def token_columns(tok):
+    # The (form, upostag, xpostag, head, deprel) columns of a Token or a conllu token, in the order
+    # Token takes them
+    if isinstance(tok, Token):
+        return tok.form, tok.upostag, tok.xpostag, tok.head, tok.deprel
+    return tok['form'], tok['upostag'], tok['xpostag'], tok['head'], tok['deprel']
+
 
 def is_aux(tok):
-    return (tok['form'].lower() in AUX or tok['xpostag'] == 'MD' or tok['form'] == 'there')
+    return (tok.lower in AUX or tok.xpostag == 'MD' or tok.form == 'there')
 
 def is_verb(tok):
-    return (tok['xpostag'].startswith('V') or tok['upostag'] in ['VERB', 'AUX'] or tok['xpostag'] == 'MD')
+    return (tok.xpostag.startswith('V') or tok.upostag in VERB_UPOS or tok.xpostag == 'MD')
+
+
+def index_tree(sent):
+    # Built once per sentence: children of every token (by head id, in sentence order),
+    # the first token of every deprel, and preorder intervals so that a token is a descendant
+    # of head iff enter[head] <= enter[tok] < leave[head].
+    n = len(sent)
+    children = [[] for _ in range(n)]
+    roots = []
+    by_deprel = {}
+    for tok in sent:
+        head = tok.head
+        if 0 <= head < n:
+            children[head].append(tok)
+        else:
+            roots.append(tok)
+        if tok.deprel not in by_deprel:
+            by_deprel[tok.deprel] = tok
+
+    enter = [-1] * n
+    leave = [-1] * n
+    clock = 0
+    stack = [(tok, False) for tok in reversed(roots)]
+    while stack:
+        tok, done = stack.pop()
+        if done:
+            leave[tok.id] = clock
+            continue
+        enter[tok.id] = clock
+        clock += 1
+        stack.append((tok, True))
+        stack.extend((c, False) for c in reversed(children[tok.id]))
+    return children, by_deprel, enter, leave
 
 
 def add_affix(candidates, afxs, postag, pos='left'):
+    # The new candidates are views sharing the tokens of the original ones
     assert(pos in ['left', 'right'])
     new_candidates = []
     for c in candidates:
         for afx in afxs:
-            c_copy = deepcopy(c)
-            c_copy.add_affix([{'form': afx, 'xpostag': postag}], pos)
-            new_candidates.append(c_copy)
+            new_candidates.append(c.with_affix([Token(afx, xpostag=postag)], pos))
     return new_candidates
 
+
+def inflect(toks, past=False, pres_3sg=False):
+    # Copy-on-write tense change: returns {id(tok): changed copy}, the tokens themselves are left untouched
+    changed = {}
+    if past:
+        for tok in toks:
+            new_tok = tok.copy()
+            new_tok.form = conjugate(tok.form, PAST)
+            new_tok.xpostag = 'VBD'
+            changed[id(tok)] = new_tok
+    elif pres_3sg:
+        for tok in toks:
+            new_tok = tok.copy()
+            new_tok.form = conjugate(tok.form, PRES_3SG)
+            new_tok.xpostag = 'VBZ'
+            changed[id(tok)] = new_tok
+    return changed
+
+
 def lower(sent):
     return str(sent).lower().translate(translator).strip()
 
 
+class _lazy(object):
+    # Attribute computed by the decorated method on first use and then stored in the instance, so later
+    # reads do not go through the descriptor. Like functools.cached_property, which takes a lock on first
+    # use before Python 3.12. Unless obj._lazy_values is None, the value is also kept in that dict, which
+    # an object can share with its copies, so a copy finds a value the original or another copy computed
+    # after it was made.
+    def __init__(self, func):
+        self.func = func
+        self.name = func.__name__
+
+    def __get__(self, obj, cls=None):
+        if obj is None:
+            return self
+        shared = obj._lazy_values
+        if shared is None:
+            value = obj.__dict__[self.name] = self.func(obj)
+            return value
+        value = shared.get(self.name, _MISSING)
+        if value is _MISSING:
+            value = shared[self.name] = self.func(obj)
+        obj.__dict__[self.name] = value
+        return value
+
+
+_MISSING = object()
+
+
+# Opt-in profiling. enable_profiling() wraps these methods with timers and turns on the outcome
+# counters in qa2d; while it is off nothing is wrapped and qa2d only checks a global.
+PROFILED_METHODS = [('Question', '_get_wh_pos'), ('Question', '_wh_is_compl'), ('Question', '_get_dobj_pos'),
+                    ('Question', 'get_answer_pos'), ('Question', 'swap_aux'), ('Question', 'change_tense'),
+                    ('Question', 'insert_answer'), ('AnswerSpan', 'change_tense')]
+_profile = None
+_unwrapped = {}
+# Guards the counters, which the reader thread of a pipeline updates too (see count_result)
+_counters_lock = None
+
+
+def _timed(name, func):
+    def timed(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            timer = _profile['timers'].setdefault(name, {'calls': 0, 'total_s': 0.0})
+            timer['calls'] += 1
+            timer['total_s'] += time.perf_counter() - start
+    timed.__wrapped__ = func
+    return timed
+
+
+def enable_profiling():
+    if _profile is None:
+        reset_profile()
+    for cls_name, method in PROFILED_METHODS:
+        key = cls_name + '.' + method
+        if key not in _unwrapped:
+            cls = globals()[cls_name]
+            _unwrapped[key] = cls.__dict__[method]
+            setattr(cls, method, _timed(key, _unwrapped[key]))
+    return
+
+
+def disable_profiling():
+    global _profile
+    for key, func in _unwrapped.items():
+        cls_name, method = key.split('.')
+        setattr(globals()[cls_name], method, func)
+    _unwrapped.clear()
+    _profile = None
+    return
+
+
+def reset_profile():
+    global _profile, _counters_lock
+    if _counters_lock is None:
+        import threading
+        _counters_lock = threading.Lock()
+    _profile = {'timers': {}, 'counters': {}}
+    return
+
+
+def _count(counter, key):
+    with _counters_lock:
+        counts = _profile['counters'].setdefault(counter, {})
+        counts[key] = counts.get(key, 0) + 1
+    return
+
+
+def count_result(result, source, reasons=()):
+    # Counts a result that did not come from qa2d, such as a prefilter verdict or a cached result, the
+    # way qa2d counts its own, and where it came from. reasons are those of an invalid question
+    # (see Question.invalid_reasons), where the source knows them.
+    if _profile is None:
+        return
+    _count('status', result.status)
+    _count('source', source)
+    if result.status == INVALID_QUESTION:
+        for reason in reasons:
+            _count('invalid_question', reason)
+    elif result.status == OK:
+        _count('type', result.type)
+    return
+
+
+def profile_report():
+    # Machine-readable summary of the run so far (None when profiling is off); diff two runs with sorted keys
+    if _profile is None:
+        return None
+    timers = dict((name, {'calls': t['calls'], 'total_s': round(t['total_s'], 6),
+                          'mean_us': round(t['total_s'] / t['calls'] * 1e6, 3)})
+                  for name, t in _profile['timers'].items())
+    return {'timers': timers, 'counters': dict((c, dict(v)) for c, v in _profile['counters'].items())}
+
+
+def merge_profile(report):
+    # Adds a report from another process (see qa2d_batch) to the totals of this one
+    if _profile is None or report is None:
+        return
+    for name, t in report['timers'].items():
+        timer = _profile['timers'].setdefault(name, {'calls': 0, 'total_s': 0.0})
+        timer['calls'] += t['calls']
+        timer['total_s'] += t['total_s']
+    with _counters_lock:
+        for counter, counts in report['counters'].items():
+            for key, n in counts.items():
+                mine = _profile['counters'].setdefault(counter, {})
+                mine[key] = mine.get(key, 0) + n
+    return
+
+
+def qa2d(question, answer, features=None):
+    # Transforms one (question tokens, answer tokens) pair; Token inputs are modified in place.
+    # features are analysis features of the question computed beforehand (see Question).
+    result = _qa2d(question, answer, features)
+    if _profile is not None:
+        _count('status', result.status)
+    return result
+
+
+def _qa2d(question, answer, features=None):
+    try:
+        q = Question(question, features)
+        if not q.isvalid:
+            if _profile is not None:
+                for reason in q.invalid_reasons():
+                    _count('invalid_question', reason)
+            return QA2DResult(INVALID_QUESTION, None)
+        a = AnswerSpan(answer)
+        if not a.isvalid:
+            return QA2DResult(INVALID_ANSWER, None)
+        q.insert_answer_default(a)
+        if _profile is not None:
+            _count('type', q.type)
+        return QA2DResult(OK, q.format_declr(), q.type, q._answer_pos)
+    except Exception:
+        return QA2DResult(ERROR, None)
+
+
+def qa2d_multi(question, answers):
+    # Transforms one question with each of several answers, analyzing the question only once
+    try:
+        q = Question(question)
+    except Exception:
+        return [QA2DResult(ERROR) for _ in answers]
+    if not q.isvalid:
+        return [QA2DResult(INVALID_QUESTION) for _ in answers]
+    results = []
+    for answer in answers:
+        try:
+            a = AnswerSpan(answer)
+            results.append(q.transform(a) if a.isvalid else QA2DResult(INVALID_ANSWER))
+        except Exception:
+            results.append(QA2DResult(ERROR))
+    return results
+
+
+def _qa2d_chunk(chunk, profile=False):
+    # Runs in a worker process; with profile, also returns the profile of this chunk
+    if profile:
+        enable_profiling()
+        reset_profile()
+    results = [item if isinstance(item, QA2DResult) else qa2d(*item) for item in chunk]
+    return results, profile_report()
+
+
+def qa2d_batch(pairs, workers=None, chunksize=64):
+    # Yields one QA2DResult per (question, answer) pair or (question, answer, features) triple, in
+    # input order. Items that already are a QA2DResult (e.g. from features.prefilter) are passed through.
+    # Pairs are sent to the pool in chunks, with at most 2 chunks per worker in flight,
+    # so the input iterable is consumed lazily.
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1:
+        for item in pairs:
+            yield item if isinstance(item, QA2DResult) else qa2d(*item)
+        return
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    # Before the workers start, which do not warn (see verbs.has_pattern)
+    has_pattern()
+    pairs = iter(pairs)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        while True:
+            while len(pending) < 2 * workers:
+                chunk = list(islice(pairs, chunksize))
+                if len(chunk) == 0:
+                    break
+                pending.append(pool.submit(_qa2d_chunk, chunk, _profile is not None))
+            if len(pending) == 0:
+                break
+            results, report = pending.popleft().result()
+            merge_profile(report)
+            for result in results:
+                yield result
+
+
 class Question:
-    def __init__(self, question):
-        self.question = self._preprocess(question)
+    def __init__(self, question, features=None):
+        # Tokens in their original order. The rewriting steps do not rebuild the token list, they
+        # append to an edit script (self.edits) that the question property applies in one pass.
+        self._tokens = self._preprocess(question)
+        self.edits = []
+        self._applied = None
+        self._lazy_values = None
+        if features is not None:
+            # Analysis features computed for a whole shard at once (see features.feature_rows), which
+            # are then not computed again
+            if not _question_feature_set.issuperset(features):
+                raise ValueError('not a feature Question takes: {}'.format(
+                    ', '.join(sorted(set(features) - _question_feature_set))))
+            self.__dict__.update(features)
+        self._children, self._by_deprel, self._enter, self._leave = index_tree(self._tokens)
         self.root = self._get_node('root')
+        # The root of the parse, which self.root stops being when a modal and 'be' make the copula the root
+        self._tree_root = self.root
         self.wh = self._get_wh()
         self.isvalid = self._is_valid()
-        self.lastword_idx = self._lastword_idx()
-        self.dangling_prep = self._dangling_prep()
+        self._answer_pos = None
+        self._new_aux_pos = None
+        self._verb_pos = None
+        if not self.isvalid:
+            # Not analyzed any further
+            self.subj = self.aux = self.cop = self.aux_toks = None
+            return
 
         # Get the subject
         subj_nodes = self._get_children(self.root, ['nsubj', 'nsubj:pass', 'csubj'], 'anywhere')
@@ -70,9 +448,9 @@ class Question:
         # Get copula
         self.cop = self._get_node('cop')
 
-        if self.cop is not None and self.cop['form'] == 'be':
+        if self.cop is not None and self.cop.form == 'be':
             aux_nodes = self._get_children(self.root, ['aux'], 'anywhere')
-            if len(aux_nodes) > 0 and aux_nodes[0]['xpostag'] == 'MD':
+            if len(aux_nodes) > 0 and aux_nodes[0].xpostag == 'MD':
                 self.aux = aux_nodes[0]
                 self.root = self.cop
                 self.cop = None
@@ -85,51 +463,155 @@ class Question:
         self.aux_toks = None
         if self.aux is not None:
             self.aux_toks = [self.aux]
-            for tok in question[self.aux['id'] + 1:]:
+            for tok in self._tokens[self.aux.id + 1:]:
                 if is_aux(tok):
                     self.aux_toks.append(tok)
                 else:
                     break
 
-        self._answer_pos = None
-        self._new_aux_pos = None
+    # The analysis features below are computed on first use (get_answer_pos returns on the first
+    # matching branch, so most questions need only a few of them) and then cached in the instance and
+    # in _lazy_values, which a question shares with its forks once it has any: a feature is computed
+    # once, whichever of them uses it first. They read the original tokens, so it does not matter whether they are first
+    # used before or after the rewriting steps.
+
+    @_lazy
+    def lastword_idx(self):
+        return self._lastword_idx()
+
+    @_lazy
+    def dangling_prep(self):
+        return self._dangling_prep()
+
+    @_lazy
+    def wh_is_quantity(self):
+        return self._wh_is_quantity()
+
+    @_lazy
+    def wh_is_time(self):
+        return self._wh_is_time()
+
+    @_lazy
+    def wh_is_happened(self):
+        return self._wh_is_happened()
+
+    @_lazy
+    def wh_pos(self):
+        return self._get_wh_pos()
+
+    @_lazy
+    def aux_precedes_verb(self):
+        return self._aux_precedes_verb()
 
-        if self.isvalid:
-            self.wh_is_quantity = self._wh_is_quantity()
-            self.wh_is_time = self._wh_is_time()
-            self.wh_is_happened = self._wh_is_happened()
-            self.wh_pos = self._get_wh_pos()
-            self.aux_precedes_verb = self._aux_precedes_verb()
-            self.wh_is_compl = self._wh_is_compl()
-            self.dobj_pos = self._get_dobj_pos()
-            self.is_do_neg = self.is_do_neg()
+    @_lazy
+    def wh_is_compl(self):
+        return self._wh_is_compl()
+
+    @_lazy
+    def dobj_pos(self):
+        return self._get_dobj_pos()
+
+    @_lazy
+    def is_do_neg(self):
+        return self._is_do_neg()
+
+    @property
+    def question(self):
+        # The tokens with the edit script applied, rebuilt only when the script has grown
+        if len(self.edits) == 0:
+            return self._tokens
+        if self._applied is None or self._applied[0] != len(self.edits):
+            self._applied = (len(self.edits), self._apply_edits())
+        return self._applied[1]
+
+    def _apply_edits(self):
+        # Runs the edit script over a single working list that starts as the original tokens.
+        # Tokens have no __eq__, so the list searches below compare by identity.
+        order = list(self._tokens)
+        for edit in self.edits:
+            op = edit[0]
+            if op == 'move':
+                _, start, length, pos = edit
+                block = order[start:start + length]
+                if pos >= start + length:
+                    order[pos:pos] = block
+                    del order[start:start + length]
+                else:
+                    order[start:] = block + order[pos:]
+            elif op == 'delete':
+                # The first occurrence of the token at pos (swap_aux may have duplicated it)
+                order.remove(order[edit[1]])
+            elif op == 'remove':
+                if edit[1] in order:
+                    order.remove(edit[1])
+            elif op == 'inflect':
+                for old, new in edit[1]:
+                    i = 0
+                    while True:
+                        try:
+                            i = order.index(old, i)
+                        except ValueError:
+                            break
+                        order[i] = new
+            elif op == 'insert_answer':
+                # The answer replaces the wh-phrase start:end, or goes to pos with the wh-phrase removed
+                _, start, end, pos, answer = edit
+                if start == pos:
+                    order[start:end] = answer
+                elif start < pos:
+                    order[pos:pos] = answer
+                    del order[start:min(end, pos)]
+                else:
+                    del order[start:end]
+                    order[0:0] = answer
+        return order
+
+    def describe_edits(self):
+        # The edit script, one step per line, for debugging the rules
+        lines = []
+        for edit in self.edits:
+            op = edit[0]
+            if op == 'move':
+                lines.append('move {} token(s) at {} before {}'.format(edit[2], edit[1], edit[3]))
+            elif op == 'delete':
+                lines.append('delete the token at {}'.format(edit[1]))
+            elif op == 'remove':
+                lines.append('remove {!r}'.format(edit[1].form))
+            elif op == 'inflect':
+                lines.append('inflect ' + ', '.join('{!r} -> {!r}'.format(old.form, new.form) for old, new in edit[1]))
+            elif op == 'insert_answer':
+                lines.append('insert {!r} at {} and remove the wh-phrase {}:{}'.format(
+                    ' '.join(tok.form for tok in edit[4]), edit[3], edit[1], edit[2]))
+        return lines
 
     def _preprocess(self, question):
+        question = [tok if isinstance(tok, Token) else Token.from_dict(tok) for tok in question]
         for i in range(len(question)):
-            question[i]['id'] = i
-            question[i]['head'] -= 1
-            # if question[i]['form'] == '-LRB-':
-            #    question[i]['form'] = '('
-            # elif question[i]['form'] == '-RRB-':
-            #    question[i]['form'] = ')'
+            question[i].id = i
+            question[i].head -= 1
+            # if question[i].form == '-LRB-':
+            #    question[i].form = '('
+            # elif question[i].form == '-RRB-':
+            #    question[i].form = ')'
         return question
 
     def _get_node(self, rel):
-        for tok in self.question:
-            if tok['deprel'].startswith(rel):
-                return tok
-        return None
+        # First token whose deprel starts with rel
+        node = None
+        for deprel, tok in self._by_deprel.items():
+            if deprel.startswith(rel) and (node is None or tok.id < node.id):
+                node = tok
+        return node
 
     def _get_children(self, node, rels, loc='right'):
         assert (loc in ['left', 'right', 'anywhere'])
-        head_id = node['id']
+        head_id = node.id
         children = []
-        for tok in self.question:
-            if 'head' in tok and tok['head'] == head_id \
-                    and (len(rels) == 0 or tok['deprel'] in rels):
-                if loc == 'left' and tok['id'] < head_id:
+        for tok in self._children[head_id]:
+            if len(rels) == 0 or tok.deprel in rels:
+                if loc == 'left' and tok.id < head_id:
                     children.append(tok)
-                elif loc == 'right' and tok['id'] > head_id:
+                elif loc == 'right' and tok.id > head_id:
                     children.append(tok)
                 elif loc == 'anywhere':
                     children.append(tok)
@@ -145,9 +627,9 @@ class Question:
 
     def _get_wh(self):
         whs = []
-        question = self.question
+        question = self._tokens
         for tok in question:
-            if tok['xpostag'].startswith('W') and tok['form'] != 'that':
+            if tok.xpostag.startswith('W') and tok.form != 'that':
                 whs.append(tok)
         if len(whs) == 0:
             return None
@@ -155,102 +637,110 @@ class Question:
             return whs[0]
         else:
             for wh in whs:
-                if len(question) > wh['id'] + 1 \
-                        and is_verb(question[wh['id'] + 1]) and 'cl' in question[wh['id'] + 1]['deprel']:
+                if len(question) > wh.id + 1 \
+                        and is_verb(question[wh.id + 1]) and 'cl' in question[wh.id + 1].deprel:
                     continue
-                elif 'cl' in question[wh['head']]['deprel']:
+                elif 'cl' in question[wh.head].deprel:
                     continue
                 else:
                     return wh
 
     def _get_wh_pos(self):
         wh = self.wh
-        wh_idx = wh['id']
-        wh_lower = self.wh['form'].lower()
-        question = self.question
+        wh_idx = wh.id
+        wh_lower = self.wh.lower
+        question = self._tokens
 
         wh_tok_ids = [wh_idx]
-        wh_tok_heads = [wh['head']]
-        root_idx = self.root['id']
+        wh_tok_heads = [wh.head]
+        root_idx = self.root.id
         cop = self.cop
         for i, tok in enumerate(reversed(question[:wh_idx])):
-            if tok['xpostag'] in PREPS \
-                    or (wh_lower == 'what' and i == 0 and tok['form'] == 'do' and question[wh_idx - 2]['form'] == 'to'):
-                wh_tok_ids.append(tok['id'])
-                wh_tok_heads.append(tok['head'])
+            if tok.xpostag in PREPS \
+                    or (wh_lower == 'what' and i == 0 and tok.form == 'do' and question[wh_idx - 2].form == 'to'):
+                wh_tok_ids.append(tok.id)
+                wh_tok_heads.append(tok.head)
             else:
                 break
 
         if cop is not None:
-            root_idx = cop['id']
+            root_idx = cop.id
         for tok in question[wh_idx + 1:]:
-            if not is_verb(tok) and (wh_idx <= root_idx or tok['id'] in wh_tok_heads):
-                wh_tok_ids.append(tok['id'])
-                wh_tok_heads.append(tok['head'])
-            elif tok['form'] == 'of':
-                wh_tok_ids.append(tok['id'])
-                wh_tok_heads.append(tok['head'])
-            elif self.wh_is_happened and tok['form'] == 'happened':
-                wh_tok_ids.append(tok['id'])
-                if len(question) > tok['id'] + 1 and question[tok['id'] + 1]['form'] == 'to':
-                    wh_tok_ids.append(tok['id'] + 1)
+            if not is_verb(tok) and (wh_idx <= root_idx or tok.id in wh_tok_heads):
+                wh_tok_ids.append(tok.id)
+                wh_tok_heads.append(tok.head)
+            elif tok.form == 'of':
+                wh_tok_ids.append(tok.id)
+                wh_tok_heads.append(tok.head)
+            elif self.wh_is_happened and tok.form == 'happened':
+                wh_tok_ids.append(tok.id)
+                if len(question) > tok.id + 1 and question[tok.id + 1].form == 'to':
+                    wh_tok_ids.append(tok.id + 1)
                 break
             else:
                 break
         return min(wh_tok_ids), max(wh_tok_ids)
 
     def _is_valid(self):
-        question = self.question
+        question = self._tokens
         has_root = False
         has_verb = False
         has_wh = (self.wh is not None)
-        for tok in self.question:
-            if tok['deprel'] == 'root':
+        for tok in self._tokens:
+            if tok.deprel == 'root':
                 has_root = True
             if is_verb(tok):
                 has_verb = True
         return (has_root and has_verb and has_wh)
 
+    def invalid_reasons(self):
+        # Which of the checks in _is_valid fail
+        reasons = []
+        if 'root' not in self._by_deprel:
+            reasons.append('no_root')
+        if not any(is_verb(tok) for tok in self._tokens):
+            reasons.append('no_verb')
+        if self.wh is None:
+            reasons.append('no_wh')
+        return reasons
+
     def _lastword_idx(self):
-        question = self.question
+        question = self._tokens
         for i, tok in enumerate(question[::-1]):
-            if tok['xpostag'][0] in alpha and tok['xpostag'] != 'SYM':
+            if tok.xpostag[0] in alpha and tok.xpostag != 'SYM':
                 return len(question) - i - 1
         return 0
 
     def _dangling_prep(self):
-        prep = self._get_children(self.root, ['compound:prt', 'obl', 'case'], 'right')
-        question = self.question
+        # Looks at the root of the parse, as it did when it was computed in __init__ before self.root
+        # could change
+        root = self._tree_root
+        prep = self._get_children(root, ['compound:prt', 'obl', 'case'], 'right')
+        question = self._tokens
         for p in prep:
-            if p['deprel'] == 'case' and any([tok['head'] == p['id'] for tok in question[:self.root['id']]]):
+            if p.deprel == 'case' and any(tok.id < root.id for tok in self._children[p.id]):
                 return p
-            elif p['deprel'] == 'case':
+            elif p.deprel == 'case':
                 continue
-            elif p['xpostag'] in PREPS and len(question) > p['id'] + 1 and question[p['id'] + 1]['head'] > p['id']:
+            elif p.xpostag in PREPS and len(question) > p.id + 1 and question[p.id + 1].head > p.id:
                 return p
-            elif p['xpostag'] in PREPS and len(question) <= p['id'] + 1:
+            elif p.xpostag in PREPS and len(question) <= p.id + 1:
                 return p
         return None
 
     def _is_descendant(self, child, head):
-        if child == head:
+        if child is head:
             return True
-        question = self.question
-        count = 0
-        while 'head' in child and child['head'] != -1:
-            if question[child['head']] == head:
-                return True
-            child = question[child['head']]
-            count += 1
-            if count > 5:
-                break
-        return False
+        if head is None:
+            return False
+        enter = self._enter
+        return enter[head.id] <= enter[child.id] < self._leave[head.id] and enter[child.id] != -1
 
     def _get_dobj_pos(self):
-        question = self.question
+        question = self._tokens
         lastword_idx = self.lastword_idx
         root = self.root
-        root_idx = root['id']
+        root_idx = root.id
         dobj_pos = root_idx + 1
 
         # If root verb is the last word in the sentence
@@ -260,40 +750,40 @@ class Question:
         # Get complements
         comps = self._get_children(root, ['xcomp', 'compound:prt'], 'right')
         for c in comps:
-            if c['deprel'] == 'xcomp' and not is_verb(c):
+            if c.deprel == 'xcomp' and not is_verb(c):
                 continue
-            elif c['id'] + 1 > dobj_pos:
-                dobj_pos = c['id'] + 1
+            elif c.id + 1 > dobj_pos:
+                dobj_pos = c.id + 1
 
         if len(question) > dobj_pos:
             postword = question[dobj_pos]
-            if postword['xpostag'] in PREPS and postword['head'] < dobj_pos:
-                dobj_pos = postword['id'] + 1
+            if postword.xpostag in PREPS and postword.head < dobj_pos:
+                dobj_pos = postword.id + 1
 
         return min(lastword_idx + 1, dobj_pos)
 
     def _wh_is_time(self):
         wh = self.wh
-        wh_lower = wh['form'].lower()
-        wh_idx = wh['id']
-        question = self.question
+        wh_lower = wh.lower
+        wh_idx = wh.id
+        question = self._tokens
         return (wh_lower in ['what', 'which'] and len(question) > wh_idx + 1 \
-                and question[wh_idx + 1]['form'] in TIME_WORDS)
+                and question[wh_idx + 1].form in TIME_WORDS)
 
     def _wh_is_quantity(self):
-        question = self.question
+        question = self._tokens
         q_length = len(question)
-        wh_lower = self.wh['form'].lower()
-        wh_idx = self.wh['id']
-        return (q_length > wh_idx + 1 and wh_lower == 'how' and question[wh_idx + 1]['form'] in ['many', 'much'])
+        wh_lower = self.wh.lower
+        wh_idx = self.wh.id
+        return (q_length > wh_idx + 1 and wh_lower == 'how' and question[wh_idx + 1].form in ['many', 'much'])
 
     def _wh_is_happened(self):
-        question = self.question
-        wh_lower = self.wh['form'].lower()
+        question = self._tokens
+        wh_lower = self.wh.lower
         if wh_lower != 'what':
             return False
-        wh_idx = self.wh['id']
-        if len(question) > wh_idx + 1 and question[wh_idx + 1]['form'] == 'happened':
+        wh_idx = self.wh.id
+        if len(question) > wh_idx + 1 and question[wh_idx + 1].form == 'happened':
             return True
         return False
 
@@ -301,34 +791,34 @@ class Question:
         cop = self.cop
         aux = self.aux
         root = self.root
-        root_idx = root['id']
+        root_idx = root.id
         adverbs = 0
-        for tok in reversed(self.question[:root_idx]):
-            if tok['xpostag'].startswith('RB'):
+        for tok in reversed(self._tokens[:root_idx]):
+            if tok.xpostag.startswith('RB'):
                 adverbs += 1
             else:
                 break
 
-        if cop is not None and is_verb(root) and cop['id'] == root['id'] - 1 - adverbs:
+        if cop is not None and is_verb(root) and cop.id == root.id - 1 - adverbs:
             return True
-        elif aux is not None and aux['id'] == root_idx - adverbs - len(self.aux_toks):
+        elif aux is not None and aux.id == root_idx - adverbs - len(self.aux_toks):
             return True
         return False
 
     def _wh_is_compl(self):
-        question = self.question
+        question = self._tokens
         q_length = len(question)
-        wh_lower = self.wh['form'].lower()
-        wh_idx = self.wh['id']
+        wh_lower = self.wh.lower
+        wh_idx = self.wh.id
         cop = self.cop
         aux = self.aux
         root = self.root
         lastword_idx = self.lastword_idx
         quantity = self.wh_is_quantity
 
-        if ((wh_idx > 0 and question[wh_idx - 1]['xpostag'] in PREPS) \
-                    and not (quantity and question[wh_idx - 1]['form'].lower() == 'about')) \
-                or question[lastword_idx]['xpostag'] in PREPS \
+        if ((wh_idx > 0 and question[wh_idx - 1].xpostag in PREPS) \
+                    and not (quantity and question[wh_idx - 1].lower == 'about')) \
+                or question[lastword_idx].xpostag in PREPS \
                 or (wh_lower not in SUBJ_WH and not quantity) \
                 or (wh_lower in SUBJ_WH and self.dangling_prep is not None \
                             and not self.aux_precedes_verb) \
@@ -340,66 +830,63 @@ class Question:
         # Answer position is the index of the previous word + 1
         if self._answer_pos is not None:
             return self._answer_pos
-        question = self.question
+        # The lazy features are read only in the branches that need them
         wh = self.wh
-        wh_lower = wh['form'].lower()
-        wh_idx = wh['id']
+        wh_idx = wh.id
         root = self.root
-        root_idx = root['id']
+        root_idx = root.id
         aux = self.aux
         cop = self.cop
         subj = self.subj
-        lastword_idx = self.lastword_idx
-        dobj_pos = self.dobj_pos
         comps = self._get_children(root, ['xcomp'], 'right')
-        startidx, endidx = self.wh_pos
-        dangling_prep = self.dangling_prep
 
-        if self.wh_is_happened and question[endidx]['form'] == 'to':
-            head = question[question[endidx]['head']]
-            self._answer_pos = head['id'] + 1
+        if self.wh_is_happened and self.question[self.wh_pos[1]].form == 'to':
+            question = self.question
+            head = question[question[self.wh_pos[1]].head]
+            self._answer_pos = head.id + 1
             if not a.type.startswith('V'):
-                a.add_affix([{'form': 'experienced', 'xpostag': 'VBN'}], 'left')
+                a.add_affix([Token('experienced', xpostag='VBN')], 'left')
             self.type = 'WHAT_HAPPENED_TO'
         elif self.wh_is_happened:
-            self._answer_pos = lastword_idx + 1
+            self._answer_pos = self.lastword_idx + 1
             self.type = 'WHAT_HAPPENED'
-        elif wh_idx > root_idx or (cop is not None and wh_idx > cop['id']):
-            self._answer_pos = startidx
+        elif wh_idx > root_idx or (cop is not None and wh_idx > cop.id):
+            self._answer_pos = self.wh_pos[0]
             self.type = 'NO_WH_MOV'
-        elif self.wh_is_compl and dangling_prep is None:
-            self._answer_pos = lastword_idx + 1
+        elif self.wh_is_compl and self.dangling_prep is None:
+            self._answer_pos = self.lastword_idx + 1
             self.type = 'COMPL'
         elif self.wh_is_compl:
-            self._answer_pos = dangling_prep['id'] + 1
+            self._answer_pos = self.dangling_prep.id + 1
             self.type = 'COMPL'
         elif (cop is not None and wh_idx == root_idx) or aux is None \
                 or (self._is_descendant(wh, subj) and not (
-                        aux is not None and aux['id'] < root_idx - len(self.aux_toks))) \
+                        aux is not None and aux.id < root_idx - len(self.aux_toks))) \
                 or self.aux_precedes_verb:
-            self._answer_pos = startidx
+            self._answer_pos = self.wh_pos[0]
             self.type = 'SUBJ'
         elif (a.type.startswith('V') or a.cop is not None) \
-                and (root['form'] in VERB_DO or (len(comps) > 0 and comps[0]['form'] in VERB_DO)):
-            if len(comps) > 0 and comps[0]['form'] in VERB_DO:
-                self._answer_pos = comps[0]['id']
+                and (root.form in VERB_DO or (len(comps) > 0 and comps[0].form in VERB_DO)):
+            if len(comps) > 0 and comps[0].form in VERB_DO:
+                self._answer_pos = comps[0].id
             else:
                 self._answer_pos = root_idx
+            # The do-verb the answer replaces
+            self._verb_pos = self._answer_pos
             self.type = 'VERB'
         else:
-            self._answer_pos = dobj_pos
+            self._answer_pos = self.dobj_pos
             self.type = 'DOBJ'
         return self._answer_pos
 
     def set_answer_pos(self, pos):
-        question_length = len(self.question)
+        question_length = len(self._tokens)
         assert (abs(pos) < question_length + 1)
         self._answer_pos = pos
         return
 
     def remove_tok(self, tok):
-        if tok in self.question:
-            self.question.remove(tok)
+        self.edits.append(('remove', tok))
         return
 
     def set_aux_pos(self, pos):
@@ -408,9 +895,9 @@ class Question:
 
     def _get_new_aux_pos(self):
         aux = self.aux
-        old_pos = aux['id']
+        old_pos = aux.id
         root = self.root
-        root_idx = root['id']
+        root_idx = root.id
         if old_pos > root_idx:
             return old_pos
 
@@ -422,14 +909,14 @@ class Question:
         last_prev_verb = root_idx
         for tok in reversed(question[:root_idx]):
             if is_verb(tok):
-                last_prev_verb = tok['id']
+                last_prev_verb = tok.id
             else:
                 break
         last_prev_adv = last_prev_verb
         for tok in reversed(question[:last_prev_verb]):
-            if tok['xpostag'].startswith('RB') or (
-                    tok['deprel'] == 'advmod' and tok['head'] in [root_idx, last_prev_verb]):
-                last_prev_adv = tok['id']
+            if tok.xpostag.startswith('RB') or (
+                    tok.deprel == 'advmod' and tok.head in [root_idx, last_prev_verb]):
+                last_prev_adv = tok.id
             else:
                 break
 
@@ -438,18 +925,18 @@ class Question:
     def _get_new_cop_pos(self):
         cop = self.cop
         startidx, endidx = self.wh_pos
-        old_pos = cop['id']
+        old_pos = cop.id
         question = self.question
         root = self.root
-        root_idx = root['id']
+        root_idx = root.id
         subj = self.subj
         lastword_idx = self.lastword_idx
         a_pos = self._answer_pos
         if old_pos == lastword_idx:
             return old_pos
         root_mod = self._get_children(root, ['case', 'det', 'amod', 'advmod'], 'left')
-        if len(root_mod) > 0 and root_mod[-1]['id'] == root_idx - 1:
-            root_idx = root_mod[0]['id']
+        if len(root_mod) > 0 and root_mod[-1].id == root_idx - 1:
+            root_idx = root_mod[0].id
 
         if root_idx > endidx + 2 and root_idx > old_pos and self.type == 'COMPL':
             return root_idx
@@ -471,45 +958,33 @@ class Question:
         else:
             return
 
-        old_pos = word['id']
+        old_pos = word.id
         if old_pos == new_pos:
             return
-        question = self.question
-
-        neworder = [i for i in range(old_pos)] + [i + aux_length for i in range(old_pos, new_pos - aux_length)] \
-                   + [i for i in range(old_pos, old_pos + aux_length)] + [i for i in range(new_pos, len(question))]
-        self.question = [question[i] for i in neworder]
+        self.edits.append(('move', old_pos, aux_length, new_pos))
         return
 
     def change_tense(self, past=False, pres_3sg=False):
         root = self.root
         if not is_verb(root):
             return
-        conj = []
-        for tok in self.question:
-            if 'head' in tok and tok['head'] == root['id'] and tok['deprel'] == 'conj' and is_verb(tok):
-                conj.append(tok)
-        if past:
-            for tok in [root] + conj:
-                if tok['form'] == 'leave':
-                    new_form = 'left'
-                else:
-                    new_form = pattern.en.conjugate(tok['form'], tense='past')
-                tok['form'] = new_form
-                tok['xpostag'] = 'VBD'
-        elif pres_3sg:
-            for tok in [root] + conj:
-                tok['form'] = pattern.en.conjugate(tok['form'], tense='present', person=3, number='singular')
-                tok['xpostag'] = 'VBZ'
+        conj = [tok for tok in self._children[root.id] if tok.deprel == 'conj' and is_verb(tok)]
+        changed = inflect([root] + conj, past, pres_3sg)
+        if len(changed) > 0:
+            self.edits.append(('inflect', [(tok, changed[id(tok)]) for tok in [root] + conj if id(tok) in changed]))
+            self.root = changed[id(root)]
         return
 
-    def format_declr(self):
-        words = [t['form'] for t in self.question]
+    def format_declr(self, detokenize=False):
+        # The declarative as a list of tokens, or as a string with detokenize
+        words = [t.form for t in self.question]
         for i, t in enumerate(words[::-1]):
             if t == '?':
                 words = words[:-i - 1] + ['.'] + words[len(words) - i:]
                 break
         words[0] = words[0][0].upper() + words[0][1:]
+        if detokenize:
+            return detok.detokenize(words)
         return words
 
     def insert_answer(self, a):
@@ -518,29 +993,22 @@ class Question:
             return None
 
         answer = a.answer
-        question = self.question
         aux = self.aux
         startidx, endidx = self.wh_pos
 
-        if self.type == 'VERB':
-            self.remove_tok(self.question[a_pos])
+        if self.type == 'VERB' and a_pos == self._verb_pos:
+            self.edits.append(('delete', a_pos))
+        self.edits.append(('insert_answer', startidx, endidx + 1, a_pos, answer))
 
-        if startidx == a_pos:
-            self.question = question[:startidx] + answer + question[endidx + 1:]
-        elif startidx < a_pos:
-            self.question = question[:startidx] + question[endidx + 1:a_pos] + answer + question[a_pos:]
-        else:
-            self.question = answer + question[:startidx] + question[endidx + 1:]
-
-        if aux is not None and aux['form'] in AUX_DO and not self.is_do_neg:
+        if aux is not None and aux.form in AUX_DO and not self.is_do_neg:
             self.remove_tok(aux)
 
         return
 
-    def is_do_neg(self):
-        if self.aux is not None and self.aux['form'] in AUX_DO and \
-                (self.question[self.aux['id'] + 1]['form'] == 'not' \
-                         or (self.root['id'] > 0 and self.question[self.root['id'] - 1]['form'] == 'not')):
+    def _is_do_neg(self):
+        if self.aux is not None and self.aux.form in AUX_DO and \
+                (self._tokens[self.aux.id + 1].form == 'not' \
+                         or (self.root.id > 0 and self._tokens[self.root.id - 1].form == 'not')):
             return True
         else:
             return False
@@ -549,35 +1017,51 @@ class Question:
         a_pos = self._answer_pos
         if a_pos is None:
             a_pos = self.get_answer_pos(a)
-        question = self.question
+        self.rewrite()
+        a = self.default_answer(a, a_pos)
+        self.insert_answer(a)
+        return
+
+    def rewrite(self):
+        # Moves the auxiliary and changes the tense of the verb for the answer type found by get_answer_pos
+        question = self._tokens
         lastword_idx = self.lastword_idx
         aux = self.aux
         cop = self.cop
-        startidx, endidx = self.wh_pos
-        wh_lower = self.wh['form'].lower()
+        wh_lower = self.wh.lower
 
         if self.type in ['COMPL', 'DOBJ', 'VERB']:
             self.swap_aux()
         elif self.type == 'SUBJ' and wh_lower != 'who' and cop is not None and not self.aux_precedes_verb \
-                and not (len(question) > cop['id'] + 1 and question[cop['id'] + 1]['xpostag'] in PREPS):
+                and not (len(question) > cop.id + 1 and question[cop.id + 1].xpostag in PREPS):
             self.set_aux_pos(lastword_idx + 1)
             self.swap_aux()
             self.set_answer_pos(lastword_idx + 1)
 
-        if aux is not None and aux['form'] in AUX_DO and not self.is_do_neg:
-            self.change_tense(past=(aux['form'] == 'did'), pres_3sg=(aux['form'] == 'does'))
+        if aux is not None and aux.form in AUX_DO and not self.is_do_neg:
+            self.change_tense(past=(aux.form == 'did'), pres_3sg=(aux.form == 'does'))
+        return
+
+    def default_answer(self, a, a_pos):
+        # The answer span with the affixes the rules add for this question; a itself is not modified
+        question = self._tokens
+        lastword_idx = self.lastword_idx
+        aux = self.aux
+        startidx, endidx = self.wh_pos
+        wh_lower = self.wh.lower
 
         if wh_lower == 'whose':
             a = add_affix([a], ["'s"], 'poss', 'right')[0]
 
-        if self.type == 'VERB' and aux is not None and a_pos == self.root['id']:
-            a.change_tense(past=(aux['form'] == 'did'), pres_3sg=(aux['form'] == 'does'))
+        if self.type == 'VERB' and aux is not None and a_pos == self.root.id:
+            a = a.with_affix([], 'left')
+            a.change_tense(past=(aux.form == 'did'), pres_3sg=(aux.form == 'does'))
 
-        if question[startidx]['xpostag'] in PREPS and a.answer[0]['xpostag'] not in PREPS:
-            a = add_affix([a], [question[startidx]['form'].lower()], question[startidx]['xpostag'], 'left')[0]
+        if question[startidx].xpostag in PREPS and a.answer[0].xpostag not in PREPS:
+            a = add_affix([a], [question[startidx].lower], question[startidx].xpostag, 'left')[0]
 
         elif self.type == 'COMPL' and \
-                (a.answer[0]['xpostag'] not in PREPS and question[lastword_idx]['xpostag'] not in PREPS) \
+                (a.answer[0].xpostag not in PREPS and question[lastword_idx].xpostag not in PREPS) \
                 and self.dangling_prep is None:
             if wh_lower in PREP_DICT and not (wh_lower == 'how' and startidx != endidx):
                 prep = PREP_DICT[wh_lower]
@@ -586,14 +1070,70 @@ class Question:
                 a = add_affix([a], [prep], 'IN', 'left')[0]
             elif self.wh_is_time:
                 a = add_affix([a], [PREP_DICT['when']], 'IN', 'left')[0]
-
-        self.insert_answer(a)
-        return
+        return a
+
+    def _fork(self):
+        # Shallow copy sharing the analysis and the tokens, with its own copy of the edit script,
+        # so the copy can be rewritten without affecting this question
+        if self._lazy_values is None:
+            self._lazy_values = {}
+        other = Question.__new__(Question)
+        other.__dict__.update(self.__dict__)
+        other.edits = list(self.edits)
+        return other
+
+    def transform(self, a):
+        # insert_answer_default on a copy: neither this question nor a is modified, so one analyzed
+        # question can be shared by any number of answers
+        q = self._fork()
+        q._answer_pos = None
+        q._new_aux_pos = None
+        q._verb_pos = None
+        q.insert_answer_default(a.with_affix([], 'left'))
+        return QA2DResult(OK, q.format_declr(), q.type, q._answer_pos)
+
+    def nbest(self, a, preps=()):
+        # Candidate declaratives for answer span a, the default one (insert_answer_default) first.
+        # The others insert the answer with and without the default affix, or with each of preps,
+        # at the default position, the wh-phrase position and the end of the sentence. VERB and
+        # WHAT_HAPPENED_TO answers replace the do-verb or follow the head of 'to', and SUBJ answers
+        # precede the verb, so they are only inserted at the default position. Verbal answers take
+        # no preposition.
+        # Neither this question nor a is modified, and the candidates share their tokens.
+        base = self._fork()
+        base._answer_pos = None
+        base._new_aux_pos = None
+        base._verb_pos = None
+        # get_answer_pos may add an affix to its answer, the other variants start from a itself
+        default = a.with_affix([], 'left')
+        a_pos = base.get_answer_pos(default)
+        base.rewrite()
+        a = a.with_affix([], 'left')
+        answers = [base.default_answer(default, a_pos), a]
+        if a.type is None or not a.type.startswith('V'):
+            answers += add_affix([a], preps, 'IN', 'left')
+        positions = [base._answer_pos]
+        if base.type not in ('VERB', 'WHAT_HAPPENED_TO', 'SUBJ'):
+            positions += [base.wh_pos[0], base.lastword_idx + 1]
+
+        candidates = []
+        seen = set()
+        for pos in positions:
+            for answer in answers:
+                q = base._fork()
+                q.set_answer_pos(pos)
+                q.insert_answer(answer)
+                declr = q.format_declr()
+                if tuple(declr) not in seen:
+                    seen.add(tuple(declr))
+                    candidates.append(Candidate(pos, answer, declr))
+        return candidates
 
 
 class AnswerSpan:
     def __init__(self, answer):
         self.answer = self._preprocess(answer)
+        self._children, self._by_deprel = index_tree(self.answer)[:2]
         self.isvalid = self._isvalid()
         self.root = self._get_rel('root')
         self.cop = self._get_rel('cop')
@@ -606,27 +1146,25 @@ class AnswerSpan:
         if self.root is None:
             return None
         else:
-            return self.root['xpostag']
+            return self.root.xpostag
 
     def _get_rel(self, rel):
-        answer = self.answer
-        for tok in answer:
-            if tok['deprel'] == rel:
-                return tok
-        return None
+        return self._by_deprel.get(rel)
 
     def _preprocess(self, answer):
+        answer = [tok if isinstance(tok, Token) else Token.from_dict(tok) for tok in answer]
         for i in range(len(answer)):
-            answer[i]['id'] = i
-            answer[i]['head'] -= 1
-            # if answer[i]['form'] == '-LRB-':
-            #    answer[i]['form'] = '('
-            # elif answer[i]['form'] == '-RRB-':
-            #    answer[i]['form'] = ')'
-        if answer[-1]['upostag'] == 'PUNCT':
+            answer[i].id = i
+            answer[i].head -= 1
+            # if answer[i].form == '-LRB-':
+            #    answer[i].form = '('
+            # elif answer[i].form == '-RRB-':
+            #    answer[i].form = ')'
+        # An empty answer (e.g. a block of comment lines) stays empty and is not valid
+        if len(answer) > 0 and answer[-1].upostag == 'PUNCT':
             answer = answer[:-1]
-        if len(answer) > 0 and not answer[0]['xpostag'].startswith('NNP'):
-            answer[0]['form'] = answer[0]['form'][0].lower() + answer[0]['form'][1:]
+        if len(answer) > 0 and not answer[0].xpostag.startswith('NNP'):
+            answer[0].form = answer[0].form[0].lower() + answer[0].form[1:]
         return answer
 
     def add_affix(self, afx_node, pos='left'):
@@ -636,26 +1174,23 @@ class AnswerSpan:
             self.answer = self.answer + afx_node
         return
 
+    def with_affix(self, afx_node, pos='left'):
+        # Like add_affix, but returns a new span and leaves this one unchanged.
+        # Both spans share their tokens; change_tense copies the tokens it changes.
+        other = AnswerSpan.__new__(AnswerSpan)
+        other.__dict__.update(self.__dict__)
+        other.add_affix(afx_node, pos)
+        return other
+
     def change_tense(self, past=False, pres_3sg=False):
         root = self.root
         if root is None or not is_verb(root):
             return
-        conj = []
-        for tok in self.answer:
-            if 'head' in tok and tok['head'] == root['id'] and tok['deprel'] == 'conj' and is_verb(tok):
-                conj.append(tok)
-        if past:
-            for tok in [root] + conj:
-                if tok['form'] == 'leave':
-                    new_form = 'left'
-                else:
-                    new_form = pattern.en.conjugate(tok['form'], tense='past')
-                tok['form'] = new_form
-                tok['xpostag'] = 'VBD'
-        elif pres_3sg:
-            for tok in [root] + conj:
-                tok['form'] = pattern.en.conjugate(tok['form'], tense='present', person=3, number='singular')
-                tok['xpostag'] = 'VBZ'
+        conj = [tok for tok in self._children[root.id] if tok.deprel == 'conj' and is_verb(tok)]
+        changed = inflect([root] + conj, past, pres_3sg)
+        if len(changed) > 0:
+            self.answer = [changed.get(id(tok), tok) for tok in self.answer]
+            self.root = changed[id(root)]
         return
 
 
@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from concurrent.futures.process import BrokenProcessPool
+
+import rule
+import verbs
+from adapter import from_words
+from detok import detokenize
+
+# Protocol: one JSON object per line in both directions.
+# Request:  {"id": ..., "question": [token, ...], "answer": [token, ...], "head_base": 1}, where every token
+#           has the CoNLL-U fields form, upostag, xpostag, head and deprel (or text, upos, xpos, head,
+#           deprel). With head_base 1 (the default) heads are as in CoNLL-U (1-based, 0 for the root);
+#           with head_base 0 they are 0-based and the root has -1, null or its own index.
+# Response: {"id": ..., "status": ..., "declr": [word, ...], "text": ..., "type": ..., "answer_pos": ...}
+# Responses on a connection come back in the order of its requests.
+
+
+def _warm_up():
+    # Executor initializer: loads the lazily loaded resources in every worker before its first request
+    rule.get_common_preps()
+    # Reads inflections.tsv; 'be' is in it, so the backend for the verbs it lacks is loaded on its own
+    # (has_pattern does not warn in a worker)
+    verbs.conjugate('be', verbs.PAST)
+    verbs.has_pattern()
+
+
+def _convert_batch(batch):
+    responses = []
+    for request_id, question, answer, head_base in batch:
+        try:
+            question = from_words(question, head_base)
+            answer = from_words(answer, head_base)
+        except (ValueError, TypeError) as e:
+            responses.append({'id': request_id, 'status': rule.ERROR, 'error': 'bad tokens: {}'.format(e)})
+            continue
+        result = rule.qa2d(question, answer)
+        responses.append({'id': request_id, 'status': result.status, 'declr': result.declr,
+                          'text': None if result.declr is None else detokenize(result.declr),
+                          'type': result.type, 'answer_pos': result.answer_pos})
+    return responses
+
+
+def make_executor(workers):
+    if workers > 0:
+        # The workers are forked from a fork server, not from this process: a pool started while
+        # connections are open would otherwise keep their sockets (and the listening one) open.
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        return ProcessPoolExecutor(max_workers=workers, initializer=_warm_up,
+                                   mp_context=multiprocessing.get_context('forkserver'))
+    # Converts in a thread of this process instead of a worker pool
+    from concurrent.futures import ThreadPoolExecutor
+    return ThreadPoolExecutor(max_workers=1, initializer=_warm_up)
+
+
+class MicroBatcher(object):
+    # Collects concurrent requests into batches of up to batch_size, waiting at most max_wait seconds
+    # after the first request of a batch, and runs up to `workers` batches at a time on the executor.
+    # A worker process that dies breaks the whole pool: the pool is then replaced by a new one from
+    # make_executor and the batches it was running are tried once more.
+    def __init__(self, executor, workers, batch_size=32, max_wait=0.002, make_executor=None):
+        self.executor = executor
+        self.make_executor = make_executor
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.queue = asyncio.Queue()
+        self.slots = asyncio.Semaphore(max(workers, 1))
+        self.batches = 0
+        self.requests = 0
+        self.restarts = 0
+
+    def submit(self, request_id, question, answer, head_base=1):
+        future = asyncio.get_event_loop().create_future()
+        self.queue.put_nowait(((request_id, question, answer, head_base), future))
+        return future
+
+    async def run(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            await self.slots.acquire()
+            loop.create_task(self._run_batch(batch))
+
+    def _restart(self, broken):
+        # Several batches fail on the same broken pool; only the first of them replaces it
+        if self.executor is broken:
+            sys.stderr.write('Worker pool broken, starting a new one\n')
+            broken.shutdown(wait=False)
+            self.executor = self.make_executor(self.workers)
+            self.restarts += 1
+
+    async def _convert(self, items):
+        loop = asyncio.get_event_loop()
+        executor = self.executor
+        try:
+            return await loop.run_in_executor(executor, _convert_batch, items)
+        except BrokenProcessPool:
+            if self.make_executor is None:
+                raise
+            self._restart(executor)
+            return await loop.run_in_executor(self.executor, _convert_batch, items)
+
+    async def _run_batch(self, batch):
+        try:
+            responses = await self._convert([item for item, _ in batch])
+            for (_, future), response in zip(batch, responses):
+                if not future.done():
+                    future.set_result(response)
+        except Exception as e:
+            for (item, future) in batch:
+                if not future.done():
+                    future.set_result({'id': item[0], 'status': rule.ERROR, 'error': repr(e)})
+        finally:
+            self.slots.release()
+            self.batches += 1
+            self.requests += len(batch)
+
+
+async def _write_responses(writer, futures):
+    while True:
+        future = await futures.get()
+        if future is None:
+            break
+        response = await future
+        try:
+            writer.write((json.dumps(response) + '\n').encode('utf-8'))
+            await writer.drain()
+        except ConnectionError:
+            # The client is gone; the rest of its responses are dropped
+            break
+
+
+async def handle_connection(batcher, reader, writer):
+    futures = asyncio.Queue()
+    writer_task = asyncio.get_event_loop().create_task(_write_responses(writer, futures))
+    reset = False
+    try:
+        while True:
+            try:
+                line = await reader.readline()
+            except ConnectionError:
+                reset = True
+                break
+            if not line:
+                break
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line.decode('utf-8'))
+                future = batcher.submit(request.get('id'), request['question'], request['answer'],
+                                        request.get('head_base', 1))
+            except (ValueError, KeyError, AttributeError) as e:
+                future = asyncio.get_event_loop().create_future()
+                future.set_result({'id': None, 'status': rule.ERROR, 'error': 'bad request: {!r}'.format(e)})
+            futures.put_nowait(future)
+    finally:
+        if reset:
+            # Nobody is left to read the responses still pending
+            writer_task.cancel()
+        else:
+            futures.put_nowait(None)
+        await asyncio.gather(writer_task, return_exceptions=True)
+        writer.close()
+
+
+async def serve(host='127.0.0.1', port=8765, path=None, workers=1, batch_size=32, max_wait=0.002, backlog=1024):
+    executor = make_executor(workers)
+    loop = asyncio.get_event_loop()
+    start = time.time()
+    # Starts the pool: the pool starts a worker for every task that finds no idle one, and each worker
+    # runs _warm_up before it takes its first task
+    await asyncio.gather(*[loop.run_in_executor(executor, os.getpid) for _ in range(max(workers, 1))])
+    sys.stderr.write('Started {} worker(s) in {:.2f}s\n'.format(max(workers, 1), time.time() - start))
+
+    batcher = MicroBatcher(executor, workers, batch_size, max_wait, make_executor)
+    batch_task = loop.create_task(batcher.run())
+
+    def handler(reader, writer):
+        return handle_connection(batcher, reader, writer)
+
+    if path is not None:
+        server = await asyncio.start_unix_server(handler, path=path, backlog=backlog)
+        sys.stderr.write('Listening on {}\n'.format(path))
+    else:
+        server = await asyncio.start_server(handler, host, port, backlog=backlog)
+        sys.stderr.write('Listening on {}:{}\n'.format(host, port))
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        batch_task.cancel()
+        batcher.executor.shutdown()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve the rule-based QA2D model over a local socket '
+                                                 '(one JSON request per line).')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', metavar='PATH', help='listen on a Unix socket instead of TCP')
+    parser.add_argument('-j', '--workers', type=int, default=1,
+                        help='worker processes (default: 1, 0 to convert in the server process)')
+    parser.add_argument('--batch-size', type=int, default=32, help='max requests per batch (default: %(default)s)')
+    parser.add_argument('--max-wait-ms', type=float, default=2.0,
+                        help='max time a request waits for its batch to fill (default: %(default)s)')
+    parser.add_argument('--backlog', type=int, default=1024,
+                        help='connections waiting to be accepted, capped by the system '
+                             '(net.core.somaxconn on Linux; default: %(default)s)')
+    args = parser.parse_args(argv)
+    # Warns here, once, if verbs fall back to the regular rules, rather than in every worker
+    verbs.has_pattern()
+    try:
+        asyncio.run(serve(args.host, args.port, args.unix, args.workers, args.batch_size, args.max_wait_ms / 1000.0,
+                          args.backlog))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
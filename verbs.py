@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+import os
+import sys
+import warnings
+from functools import lru_cache
+
+PAST = 'past'
+PRES_3SG = '3sg'
+
+# Forms that the conjugation backend gets wrong
+OVERRIDES = {('leave', PAST): 'left'}
+
+TABLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'inflections.tsv')
+
+# The start of the warning given when pattern.en is missing
+NO_PATTERN_WARNING = 'pattern is not installed'
+
+# Filled on first use: (verb, tense) -> form from the on-disk table, and the pattern.en conjugate function
+_table = None
+_pattern_conjugate = None
+
+
+def load_table(path=TABLE_PATH):
+    # Each line is: verb <tab> past <tab> 3rd person singular present
+    table = {}
+    if not os.path.exists(path):
+        return table
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.startswith('#') or not line.strip():
+                continue
+            verb, past, pres_3sg = line.rstrip('\n').split('\t')
+            table[(verb, PAST)] = past
+            table[(verb, PRES_3SG)] = pres_3sg
+    return table
+
+
+def set_table(table):
+    global _table
+    _table = table
+    conjugate.cache_clear()
+
+
+VOWELS = 'aeiou'
+# Verbs of more than one syllable stressed on the last one, which double the final consonant as well
+STRESSED_FINAL = ('mit', 'cur', 'pel', 'trol', 'quip', 'gret')
+STRESSED_WORDS = frozenset(['prefer', 'refer', 'confer', 'defer', 'infer', 'transfer', 'deter', 'rebel'])
+UNSTRESSED_FINAL = frozenset(['limit', 'vomit'])
+# Endings of verbs not stressed on the last syllable that double the final consonant all the same
+# (format -> formatted, program -> programmed, kidnap -> kidnapped)
+DOUBLED_FINAL = ('format', 'gram', 'kidnap', 'cap', 'zag')
+
+
+def _doubles_final(verb):
+    # Whether the final consonant is doubled before -ed: a stressed final syllable ending in a single
+    # vowel and a consonant other than w, x or y (stop -> stopped, admit -> admitted, but visit -> visited)
+    letters = verb.replace('qu', 'qw')
+    if len(letters) < 3 or letters[-1] in VOWELS + 'wxy' or letters[-2] not in VOWELS or letters[-3] in VOWELS:
+        return False
+    if verb in STRESSED_WORDS or verb.endswith(DOUBLED_FINAL) \
+            or (verb.endswith(STRESSED_FINAL) and verb not in UNSTRESSED_FINAL):
+        return True
+    syllables = sum(1 for i, c in enumerate(letters) if c in VOWELS and (i == 0 or letters[i - 1] not in VOWELS))
+    return syllables == 1
+
+
+def _regular(verb, tense):
+    # Used only when neither the table nor pattern knows the verb
+    consonant_y = len(verb) > 1 and verb.endswith('y') and verb[-2] not in VOWELS
+    if tense == PAST:
+        if verb.endswith('e'):
+            return verb + 'd'
+        elif consonant_y:
+            return verb[:-1] + 'ied'
+        elif verb.endswith('ic') and len(verb) > 3:
+            return verb + 'ked'
+        elif _doubles_final(verb):
+            return verb + verb[-1] + 'ed'
+        return verb + 'ed'
+    if verb.endswith(('s', 'x', 'z', 'ch', 'sh', 'o')):
+        return verb + 'es'
+    elif consonant_y:
+        return verb[:-1] + 'ies'
+    return verb + 's'
+
+
+def has_pattern():
+    # Whether pattern.en is installed. The first call warns if it is not, at its caller. Worker processes
+    # never warn: the drivers (qa2d.main, qa2d_batch, Pipeline.run, server.main, distributed.run_work and
+    # distributed.run_local) call this before they start them.
+    global _pattern_conjugate
+    if _pattern_conjugate is None:
+        try:
+            from pattern.en import conjugate as pattern_conjugate
+        except ImportError:
+            import multiprocessing
+            pattern_conjugate = False
+            if multiprocessing.parent_process() is None:
+                warnings.warn('{}: verbs missing from {} are inflected with regular rules'.format(
+                    NO_PATTERN_WARNING, os.path.basename(TABLE_PATH)), RuntimeWarning, stacklevel=2)
+        _pattern_conjugate = pattern_conjugate
+    return _pattern_conjugate is not False
+
+
+def _backend(verb, tense):
+    if _pattern_conjugate is None:
+        has_pattern()
+    if _pattern_conjugate is False:
+        return _regular(verb, tense)
+    if tense == PAST:
+        return _pattern_conjugate(verb, tense='past')
+    return _pattern_conjugate(verb, tense='present', person=3, number='singular')
+
+
+@lru_cache(maxsize=65536)
+def conjugate(verb, tense):
+    assert (tense in [PAST, PRES_3SG])
+    global _table
+    key = (verb, tense)
+    if key in OVERRIDES:
+        return OVERRIDES[key]
+    if _table is None:
+        _table = load_table()
+    if key in _table:
+        return _table[key]
+    return _backend(verb, tense)
+
+
+def build_table(verbs, path=TABLE_PATH):
+    # Adds the forms of the verbs missing from the table at path, computed with the current backend;
+    # the verbs already in the table (and its comments) are kept as they are
+    lines = []
+    known = set()
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                lines.append(line if line.endswith('\n') else line + '\n')
+                if not line.startswith('#') and line.strip():
+                    known.add(line.split('\t', 1)[0])
+    for verb in verbs:
+        if verb not in known:
+            known.add(verb)
+            lines.append('{}\t{}\t{}\n'.format(verb, _backend(verb, PAST), _backend(verb, PRES_3SG)))
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.writelines(lines)
+    os.replace(tmp, path)
+
+
+def main(argv=None):
+    import argparse
+    from importlib.util import find_spec
+
+    parser = argparse.ArgumentParser(description='Precompute the verb inflection table with pattern.en.')
+    parser.add_argument('verbs', help='file with one verb (base form) per line')
+    parser.add_argument('-o', '--output', default=TABLE_PATH, help='table to write (default: %(default)s)')
+    args = parser.parse_args(argv)
+    if find_spec('pattern') is None:
+        parser.error('needs pattern (pip install pattern3); the regular rules would only add guesses to the table')
+    with open(args.verbs, 'r', encoding='utf-8') as f:
+        verbs = [line.strip() for line in f if line.strip()]
+    build_table(verbs, args.output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
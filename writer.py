@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+import json
+import os
+import sys
+
+from detok import detokenize
+from rule import OK
+
+COMPRESSION_SUFFIXES = {'gzip': '.gz', 'lzma': '.xz'}
+
+
+def _open(path, compression, offset=None):
+    if compression == 'gzip':
+        import gzip
+        if path == '-':
+            return gzip.GzipFile(fileobj=sys.stdout.buffer, mode='wb')
+        return gzip.open(path, 'wb')
+    if compression == 'lzma':
+        import lzma
+        if path == '-':
+            return lzma.LZMAFile(sys.stdout.buffer, mode='wb')
+        return lzma.open(path, 'wb')
+    if compression is not None:
+        raise ValueError('unknown compression {!r}'.format(compression))
+    if path == '-':
+        return sys.stdout.buffer
+    if offset is None:
+        return open(path, 'wb')
+    f = open(path, 'r+b' if os.path.exists(path) else 'wb')
+    f.seek(offset)
+    f.truncate()
+    return f
+
+
+def compression_of(path):
+    # The compression implied by the suffix of path, or None
+    for compression, suffix in COMPRESSION_SUFFIXES.items():
+        if path.endswith(suffix):
+            return compression
+    return None
+
+
+def shard_path(path, n):
+    # examples.jsonl.gz -> examples-00003.jsonl.gz
+    directory, name = os.path.split(path)
+    stem, dot, ext = name.partition('.')
+    return os.path.join(directory, '{}-{:05d}{}{}'.format(stem, n, dot, ext))
+
+
+def record(idx, result, tokenized=False):
+    # The JSON record of the QA2DResult of example idx
+    declr = None
+    if result.status == OK:
+        declr = ' '.join(result.declr) if tokenized else detokenize(result.declr)
+    return {'id': idx, 'declr': declr, 'type': result.type, 'answer_pos': result.answer_pos,
+            'skip': None if result.status == OK else result.status}
+
+
+class JsonlWriter(object):
+    # Writes one JSON object per line. Lines are buffered and written buffer_size bytes at a time.
+    # compression is 'gzip', 'lzma' or None (default: from the suffix of path). With max_bytes, the
+    # output is split into files of about max_bytes (uncompressed) each, named by shard_path.
+    # offset truncates an existing uncompressed, unsplit file there and appends to it.
+    def __init__(self, path, compression=None, max_bytes=None, buffer_size=1 << 16, offset=None):
+        if compression is None and path != '-':
+            compression = compression_of(path)
+        if max_bytes is not None and path == '-':
+            raise ValueError('cannot split stdout into files')
+        if offset is not None and (compression is not None or max_bytes is not None):
+            raise ValueError('only an uncompressed, unsplit output can be appended to')
+        self.path = path
+        self.compression = compression
+        self.max_bytes = max_bytes
+        self.buffer_size = buffer_size
+        self.paths = []
+        self._buffer = []
+        self._buffered = 0
+        self._size = 0
+        self._file = None
+        self._open(offset)
+
+    def _open(self, offset=None):
+        path = self.path if self.max_bytes is None else shard_path(self.path, len(self.paths))
+        self._file = _open(path, self.compression, offset)
+        self.paths.append(path)
+        self._size = 0
+
+    def write(self, obj):
+        line = (json.dumps(obj, ensure_ascii=False) + '\n').encode('utf-8')
+        if self.max_bytes is not None and self._size > 0 and self._size + len(line) > self.max_bytes:
+            self._write_buffer()
+            self._close_file()
+            self._open()
+        self._buffer.append(line)
+        self._buffered += len(line)
+        self._size += len(line)
+        if self._buffered >= self.buffer_size:
+            self._write_buffer()
+
+    def _write_buffer(self):
+        if len(self._buffer) > 0:
+            self._file.write(b''.join(self._buffer))
+            self._buffer = []
+            self._buffered = 0
+
+    def _close_file(self):
+        if self._file is sys.stdout.buffer:
+            self._file.flush()
+        else:
+            self._file.close()
+
+    def flush(self):
+        self._write_buffer()
+        self._file.flush()
+
+    def fileno(self):
+        return self._file.fileno()
+
+    def tell(self):
+        return self._file.tell()
+
+    def close(self):
+        if self._file is not None:
+            self._write_buffer()
+            self._close_file()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()